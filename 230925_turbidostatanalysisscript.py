@@ -1,13 +1,22 @@
+import argparse
+import cmd
 import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import warnings
 import numpy as np
-import matplotlib.pyplot as plt
 from math import log2 as log2
 from numpy import log as ln
 import unicodedata
 import re
-from sklearn.linear_model import LinearRegression
-from statistics import mean
-from copy import copy
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime, timedelta
 
 
 #Makes it easier to make output files with the desired names.
@@ -28,6 +37,98 @@ def slugify(value, allow_unicode=False):
     return re.sub(r'[-\s]+', '-', value).strip('-_')
 
 
+#Per-stage timing and counters, only collected between startinstrumentation() and stopinstrumentation()
+#While it is off, timed() hands back the same do-nothing context manager and countstat() returns straight away, so leaving the calls in costs next to nothing
+_instrumentation = None
+_nottimed = nullcontext()
+
+
+#Times a stage, e.g. "with timed('segment fits'):"
+class StageTimer:
+
+    __slots__ = ('stats', 'started')
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exception):
+        self.stats[0] = self.stats[0] + time.perf_counter() - self.started
+        self.stats[1] = self.stats[1] + 1
+
+
+def timed(stage):
+
+    if _instrumentation is None:
+        return(_nottimed)
+
+    return(StageTimer(_instrumentation['stages'].setdefault(stage, [0.0, 0])))
+
+
+#Adds n to a counter, e.g. the number of OD rows parsed
+def countstat(counter, n = 1):
+
+    if _instrumentation is not None:
+        _instrumentation['counters'][counter] = _instrumentation['counters'].get(counter, 0) + int(n)
+
+
+def startinstrumentation():
+
+    global _instrumentation
+    _instrumentation = {'stages': {}, 'counters': {}}
+
+
+#Turns instrumentation off again
+#Returns the wall time and number of calls of each stage, the counters and the peak memory use (RSS) of the process so far, as a dictionary that can be saved as JSON
+def stopinstrumentation():
+
+    global _instrumentation
+    stats = {'stages': {stage: {'seconds': seconds, 'calls': calls} for stage, (seconds, calls) in _instrumentation['stages'].items()}, 'counters': dict(_instrumentation['counters']), 'peak RSS (MB)': peakrss()}
+    _instrumentation = None
+
+    return(stats)
+
+
+#Peak memory use of this process in MB, or None where the resource module isn't available (Windows)
+def peakrss():
+
+    try:
+        import resource
+    except ImportError:
+        return(None)
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports kB, macOS reports bytes
+    return(peak / 1024**2 if sys.platform == 'darwin' else peak / 1024)
+
+
+#Runs function(*arguments), collecting its stage timings and counters if instrument is True and saving a cProfile dump to profilefilename if it isn't None
+#Returns what the function returns and the stats from stopinstrumentation() (None if instrument is False)
+def instrumented(instrument, profilefilename, function, *arguments):
+
+    global _instrumentation
+    outer = _instrumentation
+    if instrument:
+        startinstrumentation()
+    else:
+        _instrumentation = None
+
+    if profilefilename is not None:
+        import cProfile
+        profile = cProfile.Profile()
+        result = profile.runcall(function, *arguments)
+        profile.dump_stats(profilefilename)
+    else:
+        result = function(*arguments)
+
+    stats = stopinstrumentation() if instrument else None
+    _instrumentation = outer
+
+    return(result, stats)
+
+
 #Asks the user to input which vials they used and what the samples are in each vial.
 #It returns the numbers of the first and last vials used and an array containing the sample names associated with each vial.
 def getinfo_consec():
@@ -52,118 +153,507 @@ def getinfo_nonconsec():
     return(vialnums, samplenames)
 
 
+#Reads the header line of a turbidostat file, e.g. "Experiment: 230728_LRDYAceGRDarwin_expt vial 0, Fri Jul 28 15:42:16 2023"
+#Returns a dictionary with the experiment name, the vial number and the start time (as an ISO string), which are None if the line doesn't look like that, and the line itself
+def parseheader(line):
+
+    line = line.strip()
+    header = {'experiment': None, 'vial': None, 'start': None, 'line': line}
+    match = re.match(r'Experiment:\s*(.*?)\s+vial\s+(\d+),\s*(.*)$', line)
+    if match is not None:
+        header['experiment'] = match.group(1)
+        header['vial'] = int(match.group(2))
+        try:
+            header['start'] = datetime.strptime(match.group(3), '%a %b %d %H:%M:%S %Y').isoformat()
+        except ValueError:
+            pass
+
+    return(header)
+
+
+#Reads a whole turbidostat file (vialN_OD.txt or vialN_pump_log.txt) in one vectorized call
+#The first line is the header and every other line is two comma separated numbers
+#The first time a file is read, its numbers are saved in a binary sidecar (.vialN_OD.txt.npy, with the header and the file's size and modification time in .vialN_OD.txt.json)
+#After that, as long as the file's size and modification time haven't changed, the sidecar is memory-mapped instead of parsing the text again
+#The sidecar holds the two columns one after the other, so each column is contiguous
+#If the sidecar can't be written (e.g. a read-only directory) the file is just parsed every time
+#Returns an N x 2 array whose columns are contiguous (read-only if it came from the sidecar) and the header from parseheader()
+def loadvialfile(path, cache = True):
+
+    directory, filename = os.path.split(path)
+    sidecar = os.path.join(directory, '.'+filename)
+    status = os.stat(path)
+    key = {'size': status.st_size, 'mtime_ns': status.st_mtime_ns, 'layout': 'columns'}
+
+    if cache:
+        try:
+            with open(sidecar+'.json') as metafile:
+                meta = json.load(metafile)
+            if meta['key'] == key:
+                data = np.load(sidecar+'.npy', mmap_mode = 'r').T
+                countstat('rows memory-mapped', len(data))
+                return(data, meta['header'])
+        except (OSError, ValueError, KeyError):
+            pass
+
+    with open(path) as datafile:
+        header = parseheader(datafile.readline())
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            data = np.loadtxt(datafile, delimiter = ',', ndmin = 2, dtype = float).reshape(-1, 2)
+    countstat('rows parsed', len(data))
+
+    #Same layout as the sidecar, so each column is contiguous either way
+    data = np.ascontiguousarray(data.T).T
+
+    if cache:
+        try:
+            np.save(sidecar+'.tmp.npy', data.T)
+            os.replace(sidecar+'.tmp.npy', sidecar+'.npy')
+            with open(sidecar+'.tmp.json', 'w') as metafile:
+                json.dump({'key': key, 'header': header}, metafile)
+            os.replace(sidecar+'.tmp.json', sidecar+'.json')
+        except OSError:
+            pass
+
+    return(data, header)
+
+
 #Imports the .csv OD file that is made by the turbidostat (includes ODs and the time at which the OD was measured).
 #It takes in the vial number that is currently being analyzed
-#It outputs an array of arrays containing times and ODs
-#It skips the first row in the file since it contains headers
-def importOD(z):
-    
-    vialOD = []
-    with open('vial'+str(z)+'_OD.txt', newline = '') as csvfile:
-        reader = csv.reader(csvfile)
-        next(reader)
-        for row in reader:
-            vialOD.append([float(row[0]), float(row[1])])
-            
+#It takes in the directory the files are in, by default the one the script is run from
+#It outputs an N x 2 array containing times and ODs
+#It skips the first row in the file since it contains headers (use importheader() to get the experiment name and start time from it)
+def importOD(z, datadir = '.', cache = True):
+
+    vialOD, header = loadvialfile(os.path.join(datadir, 'vial'+str(z)+'_OD.txt'), cache)
+
     return(vialOD)
 
 
+#Imports the experiment name and start time from the header of the OD file
+#It takes in the vial number that is currently being analyzed and the directory the files are in
+#It outputs the header dictionary made by parseheader()
+def importheader(z, datadir = '.', cache = True):
+
+    vialOD, header = loadvialfile(os.path.join(datadir, 'vial'+str(z)+'_OD.txt'), cache)
+
+    return(header)
+
+
 #Imports the .csv pump log that is made by the turbidostat (includes the time at which dilutions (pump events) occured).
 #It takes in the vial number that is currently being analyzed
-#It outputs an array of arrays containing times and ODs
+#It takes in the directory the files are in, by default the one the script is run from
+#It outputs an array containing the pump times
 #It skips the first row in the file since it contains headers
 #It skips the second row since it is always [0,0]
-def importpumptimes(z):
-    
-    vialpumptimes = []
-    with open('vial'+str(z)+'_pump_log.txt', newline = '') as csvfile:
-        reader = csv.reader(csvfile)
-        next(reader)
-        next(reader)
-        for row in reader:
-            vialpumptimes.append(float(row[0]))
-        
+def importpumptimes(z, datadir = '.', cache = True):
+
+    pumplog, header = loadvialfile(os.path.join(datadir, 'vial'+str(z)+'_pump_log.txt'), cache)
+    vialpumptimes = pumplog[1:, 0]
+
     return(vialpumptimes)
 
 
+#One vial's data, kept as contiguous NumPy columns instead of lists of rows
+#time and od are views of the loaded file (memory-mapped when it came from the sidecar), lnod and valid are only made when first used
+#Can be passed anywhere a vialOD is taken, and then the pump times don't have to be passed as well
+#After fit(), times and onlypumpgrowthrate hold the growth rate of each section, and window() gives a part of them without copying
+class Vial:
+
+    __slots__ = ('vialnum', 'samplename', 'header', 'time', 'od', 'pumptimes', '_lnod', '_valid', 'times', 'onlypumpgrowthrate')
+
+    def __init__(self, time, od, pumptimes, vialnum = None, samplename = None, header = None):
+        self.vialnum = vialnum
+        self.samplename = samplename
+        self.header = header
+        self.time = np.ascontiguousarray(time, dtype = float)
+        self.od = np.ascontiguousarray(od, dtype = float)
+        self.pumptimes = np.ascontiguousarray(pumptimes, dtype = float)
+        self._lnod = None
+        self._valid = None
+        self.times = None
+        self.onlypumpgrowthrate = None
+
+    #Loads vialN_OD.txt and vialN_pump_log.txt from datadir through importOD() and importpumptimes()
+    @classmethod
+    def load(cls, vialnum, datadir = '.', samplename = None, cache = True):
+
+        vialOD, header = loadvialfile(os.path.join(datadir, 'vial'+str(vialnum)+'_OD.txt'), cache)
+
+        return(cls(vialOD[:, 0], vialOD[:, 1], importpumptimes(vialnum, datadir, cache), vialnum, samplename, header))
+
+    def __len__(self):
+        return(len(self.time))
+
+    #True for the readings that are not NaN and are above zero
+    @property
+    def valid(self):
+        if self._valid is None:
+            with np.errstate(invalid = 'ignore'):
+                self._valid = self.od > 0
+        return(self._valid)
+
+    #ln(OD), NaN where the reading isn't valid
+    @property
+    def lnod(self):
+        if self._lnod is None:
+            self._lnod = np.full(len(self.od), np.nan)
+            np.log(self.od, out = self._lnod, where = self.valid)
+        return(self._lnod)
+
+    #The data as an N x 2 array of times and ODs, like importOD() gives
+    @property
+    def vialOD(self):
+        return(np.column_stack((self.time, self.od)))
+
+    #Fits every section between pumping events and keeps the times and growth rates
+    #Returns what segmentfits() returns
+    def fit(self):
+
+        fits = segmentfits(self)
+        self.times = fits[4]
+        self.onlypumpgrowthrate = fits[5]
+
+        return(fits)
+
+    #The growth rates from startindex to stopindex, as a view
+    def window(self, startindex, stopindex):
+        return(self.onlypumpgrowthrate[startindex:stopindex])
+
+
+#All of the vials of one experiment, by vial number
+#Takes its name and start time from the header of the first vial's OD file
+class Experiment:
+
+    __slots__ = ('datadir', 'name', 'start', 'vials')
+
+    def __init__(self, vials, datadir = '.'):
+        self.datadir = datadir
+        self.vials = dict(vials)
+        header = next(iter(self.vials.values())).header if len(self.vials) > 0 else None
+        self.name = header['experiment'] if header else None
+        self.start = header['start'] if header else None
+
+    #Loads every vial in the vials dictionary (vial number: sample name), or list of vial numbers
+    @classmethod
+    def load(cls, datadir, vials, cache = True):
+
+        if not isinstance(vials, dict):
+            vials = {z: None for z in vials}
+
+        return(cls({z: Vial.load(z, datadir, vials[z], cache) for z in vials}, datadir))
+
+    def __getitem__(self, vialnum):
+        return(self.vials[vialnum])
+
+    def __iter__(self):
+        return(iter(self.vials.values()))
+
+    def __len__(self):
+        return(len(self.vials))
+
+
 #Applies a linear fit to the data contained in pumpgrowth, with pumpgrowth[0][:] being the x values and pumpgrowth[1][:] being the y values
-#Has to put the data contained in pumpgrowth into numpy array to do fit. In theory could instead just have pumpgrowth be a numpy array.
-#Also graphs the fit onto ax1
-#Returns the best fit slope coeficient (m in y=mx+b) and ax1 with the fit graphed on it
-def dofit(pumpgrowth, ax1):
+#Uses the same closed-form least squares as segmentslopes() so that a single segment and a whole run give identical slopes
+#Returns the best fit slope coeficient (m in y=mx+b)
+def dofit(pumpgrowth):
 
-    xarray = np.array([])
-    yarray = np.array([])
-    for x in range(len(pumpgrowth)):
-        xarray = np.append(xarray, pumpgrowth[x][0])
-        yarray = np.append(yarray, pumpgrowth[x][1])
+    pumpgrowth = np.asarray(pumpgrowth, dtype = float).reshape(-1, 2)
+    slopes, intercepts = segmentslopes(pumpgrowth[:, 0], pumpgrowth[:, 1], np.array([0]), np.array([len(pumpgrowth)]))
+
+    return(slopes[0])
+
+
+#Pulls the usable data points out of vialOD
+#Takes in vialOD (a Vial, or anything that can be turned into an N x 2 array of times and ODs)
+#Returns the times and ln(OD)s of the points that are not NaN and are above zero, and whether the very last row of vialOD was usable
+def validlnod(vialOD):
+
+    if isinstance(vialOD, Vial):
+        valid = vialOD.valid
+        t = vialOD.time[valid]
+        countstat('OD rows', len(valid))
+        countstat('OD rows skipped (NaN or not above 0)', len(valid) - len(t))
+        return(t, vialOD.lnod[valid], len(valid) > 0 and bool(valid[-1]))
+
+    vialOD = np.asarray(vialOD, dtype = float).reshape(-1, 2)
+    with np.errstate(invalid = 'ignore'):
+        valid = vialOD[:, 1] > 0
+
+    t = vialOD[valid, 0]
+    y = ln(vialOD[valid, 1])
+    lastvalid = len(valid) > 0 and bool(valid[-1])
+    countstat('OD rows', len(valid))
+    countstat('OD rows skipped (NaN or not above 0)', len(valid) - len(t))
+
+    return(t, y, lastvalid)
+
+
+#Splits the usable data points into the sections between pumping events in one pass
+#Takes in the times of the usable points (from validlnod()), whether the last row was usable and the pump times
+#A section ends at the first point at or after each pump time. That point belongs to neither section, and every pump uses up at least one point.
+#If the last row was usable and did not end a section, the points after the last pump make up a final section that ends at the last point
+#Returns the start and end (exclusive) index of each section in t and the time that goes with each section in "times"
+def segmentbounds(t, lastvalid, vialpumptimes):
+
+    n = len(t)
+    vialpumptimes = np.asarray(vialpumptimes, dtype = float).ravel()
+
+    #The first point at or after pump k that comes after the point that ended section k-1
+    pumpiteration = np.arange(len(vialpumptimes))
+    ends = np.maximum.accumulate(np.searchsorted(t, vialpumptimes, side = 'left') - pumpiteration) + pumpiteration if len(vialpumptimes) > 0 else pumpiteration
+    ends = ends[ends < n]
+    segtimes = t[ends]
+
+    if lastvalid and n > 0 and (len(ends) == 0 or ends[-1] != n - 1):
+        ends = np.append(ends, n)
+        segtimes = np.append(segtimes, t[-1])
+
+    starts = np.concatenate(([0], ends + 1))[:len(ends)].astype(ends.dtype)
+
+    return(starts, ends, segtimes)
+
+
+#Lists which points go into which section
+#Takes in the section starts and ends from segmentbounds()
+#Returns the section number of every point that is in a section and the index of that point in t
+def segmentindex(starts, ends):
+
+    counts = ends - starts
+    segid = np.repeat(np.arange(len(ends)), counts)
+    index = np.arange(len(segid)) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+
+    return(segid, index)
+
+
+#Calculates the least squares slope and intercept of every section at once from grouped sums
+#Takes in the times and ln(OD)s of the usable points and the section starts and ends from segmentbounds()
+#Times are measured from the first point of each section so that the sums don't lose precision late in long runs
+#Returns the slope and intercept (at the first point of the section) of every section
+#Sections with a single point have a slope of 0 and sections without any points have a slope of NaN
+def segmentslopes(t, y, starts, ends):
+
+    nsegments = len(ends)
+    counts = ends - starts
+    segid, index = segmentindex(starts, ends)
+
+    tt = t[index] - t[starts[segid]]
+    yy = y[index]
+
+    n = counts.astype(float)
+    st = np.bincount(segid, weights = tt, minlength = nsegments)
+    sy = np.bincount(segid, weights = yy, minlength = nsegments)
+    stt = np.bincount(segid, weights = tt * tt, minlength = nsegments)
+    sty = np.bincount(segid, weights = tt * yy, minlength = nsegments)
+
+    denominator = n * stt - st * st
+    slopes = np.divide(n * sty - st * sy, denominator, out = np.zeros(nsegments), where = denominator != 0)
+    slopes[counts == 0] = np.nan
+    countstat('segments fitted', nsegments)
+    intercepts = np.divide(sy - slopes * st, n, out = np.full(nsegments, np.nan), where = counts > 0)
+
+    return(slopes, intercepts)
+
+
+#Fits every section between pumping events
+#Takes in the vialOD and vialpumptimes array that were made by importing the two CSVs, or a Vial (then vialpumptimes can be left out)
+#Requires validlnod(), segmentbounds() and segmentslopes() that were defined above
+#Two pumps without a usable point between them leave a section with no points and no slope (NaN), which is left out so it can't turn every window that covers it into NaN
+#Returns the times and ln(OD)s of the usable points, the start and end of each section, and the time, slope and intercept of each section
+def segmentfits(vialOD, vialpumptimes = None):
+
+    if vialpumptimes is None:
+        vialpumptimes = vialOD.pumptimes
+
+    t, y, lastvalid = validlnod(vialOD)
+    starts, ends, times = segmentbounds(t, lastvalid, vialpumptimes)
+    onlypumpgrowthrate, intercepts = segmentslopes(t, y, starts, ends)
+
+    keep = ends > starts
+    countstat('empty segments left out', len(keep) - int(np.count_nonzero(keep)))
+
+    return(t, y, starts[keep], ends[keep], times[keep], onlypumpgrowthrate[keep], intercepts[keep])
 
-    model = LinearRegression().fit(np.reshape(xarray, (-1,1)), yarray)
 
-    ax1.scatter(xarray, yarray)
-    ax1.plot(xarray, model.predict(np.reshape(xarray, (-1,1))),color='k')
-    
-    return(model.coef_[0], ax1)
-    
-    
 #Calculates the growth rate for each section between pumping events
-#Takes in the vialOD and vialpumptimes array that were made by importing the two CSVs
-#Takes in ax1 that was made in the main code
-#Requires dofit() that was defined above
+#Takes in the vialOD and vialpumptimes array that were made by importing the two CSVs, or a Vial (then vialpumptimes can be left out)
+#Requires segmentfits() that was defined above (use that instead to also graph the fits)
 #Returns an array "times" that has the times at which or immediately after a pump event occurs
 #Returns an array "onlypumpgrowthrate" that has the growth rates from each pump event
 #"times" and "onlypumpgrowthrate" are of equal size, and the time can be associated with the growth rate of the section immediately before that pump event
-#Could instead have made these a numpy array
-#Also returns ax1, now with the ln(OD600)s graphed and the fits between each pump event
-def pumpgrowthrates(vialOD, vialpumptimes, ax1):
-    
-    pumpiteration = 0
+def pumpgrowthrates(vialOD, vialpumptimes = None):
 
-    if len(vialpumptimes) == 0:
-        nextpumptime = float('inf')
-    if len(vialpumptimes) > 0:
-        nextpumptime = vialpumptimes[0]
+    t, y, starts, ends, times, onlypumpgrowthrate, intercepts = segmentfits(vialOD, vialpumptimes)
 
-    pumpgrowth = []
-    pumpgrowthrate = []
-    times = []
-    onlypumpgrowthrate = []
+    return (times, onlypumpgrowthrate)
 
-    for x in range(len(vialOD)):
-        if np.isnan(vialOD[x][1]) == False and vialOD[x][1] > 0:
-            currtime = vialOD[x][0]
-            currOD = vialOD[x][1]
 
-            if currtime < nextpumptime:
-                pumpgrowth.append([vialOD[x][0], ln(vialOD[x][1])])
+#Reads the window of the rolling regression, either in hours ("2h") or in points ("25")
+#Returns the length and "hours" or "points"
+def parserollingwindow(text):
 
-            if currtime >= nextpumptime:
-                #Do fit and store data
-                slope, ax1 = dofit(pumpgrowth, ax1)
+    text = str(text).strip().lower()
+    if text.endswith('h'):
+        return(float(text[:-1]), 'hours')
 
-                times.append(currtime)
-                onlypumpgrowthrate.append(slope)
+    return(int(text), 'points')
 
-                #Reset pumpgrowth data
-                pumpgrowth = []
 
-                pumpiteration = pumpiteration + 1
+#Slope of ln(OD) against time over a window ending at every usable point, as another way to get growth rates when a vial rarely pumps
+#Uses running sums of t, ln(OD), t^2 and t*ln(OD), so every window is O(1) and the whole run is linear in the number of points
+#Takes in the times and ln(OD)s of the usable points (from validlnod()), the pump times, and the window length in "hours" or "points"
+#A window in hours covers the points in (t - window, t]
+#Windows with a pump in them (after their first point and at or before their last point) are masked, since the dilution breaks the straight line
+#Returns the slope at every point, NaN where the window was masked, went past the start of the run or had fewer than 3 points
+#Also returns which windows were masked only because of a pump, so that a failed vial can say whether a shorter window would help
+def rollingslopes(t, y, vialpumptimes, window, unit = 'points'):
 
-                if pumpiteration <= len(vialpumptimes)-1:
-                    nextpumptime = vialpumptimes[pumpiteration]
-                    x = x + 1
+    n = len(t)
+    hi = np.arange(1, n + 1)
+    if unit == 'hours':
+        lo = np.searchsorted(t, t - window, side = 'right')
+        complete = t - window >= (t[0] if n > 0 else 0)
+    else:
+        lo = hi - int(window)
+        complete = lo >= 0
+        lo = np.maximum(lo, 0)
+
+    #Times are shifted by their mean so the sums of squares keep their precision in long runs
+    tt = t - (np.mean(t) if n > 0 else 0)
+    st = np.concatenate(([0.0], np.cumsum(tt)))
+    sy = np.concatenate(([0.0], np.cumsum(y)))
+    stt = np.concatenate(([0.0], np.cumsum(tt * tt)))
+    sty = np.concatenate(([0.0], np.cumsum(tt * y)))
+
+    count = hi - lo
+    sumt = st[hi] - st[lo]
+    sumy = sy[hi] - sy[lo]
+    denominator = count * (stt[hi] - stt[lo]) - sumt * sumt
+    slopes = np.divide(count * (sty[hi] - sty[lo]) - sumt * sumy, denominator, out = np.full(n, np.nan), where = denominator > 0)
+
+    vialpumptimes = np.sort(np.asarray(vialpumptimes, dtype = float).ravel())
+    pumped = np.zeros(n, dtype = bool)
+    if n > 0:
+        pumpsinside = np.searchsorted(vialpumptimes, t[hi - 1], side = 'right') - np.searchsorted(vialpumptimes, t[lo], side = 'right')
+        unusable = ~complete | (count < 3)
+        pumped = (pumpsinside > 0) & ~unusable & ~np.isnan(slopes)
+        slopes[(pumpsinside > 0) | unusable] = np.nan
+
+    return(slopes, pumped)
+
+
+#Growth rates from rollingslopes() at points one window apart, so that neighbouring estimates don't share points, the same as the sections between pumps
+#These can go into the window search (findwindow()) in place of the times and onlypumpgrowthrate from pumpgrowthrates()
+#Takes in the same as rollingslopes()
+#Returns the times and growth rates, leaving out the masked windows, and how many of the windows were left out only because of a pump
+def rollinggrowthrates(t, y, vialpumptimes, window, unit = 'points'):
+
+    slopes, pumped = rollingslopes(t, y, vialpumptimes, window, unit)
+
+    if unit == 'hours':
+        block = np.floor((t - (t[0] if len(t) > 0 else 0)) / window).astype(int)
+        last = np.flatnonzero(np.concatenate((block[1:] != block[:-1], [True]))) if len(t) > 0 else np.array([], dtype = int)
+    else:
+        last = np.arange(int(window) - 1, len(t), int(window))
 
-                if pumpiteration > len(vialpumptimes)-1:
-                    nextpumptime = float('inf')
-                    x = x + 1
+    pumpmasked = int(np.count_nonzero(pumped[last]))
+    last = last[~np.isnan(slopes[last])]
 
-            if x == len(vialOD) - 1 and len(pumpgrowth) != 0:
-                slope, ax1 = dofit(pumpgrowth, ax1)
+    return(t[last], slopes[last], pumpmasked)
+
+
+#Makes the running sums that getwindowresiduals(), expandright() and expandleft() use to get the sum and sum of squares of any window in O(1)
+#Takes in onlypumpgrowthrate made in pumpgrowthrates()
+#The growth rates are shifted by their mean first so that the sums of squares don't lose precision
+#Returns the shift and the running sums of the shifted growth rates and of their squares, both starting with 0 so that a window [lo:hi] is sums[hi] - sums[lo]
+def prefixsums(onlypumpgrowthrate):
+
+    onlypumpgrowthrate = np.asarray(onlypumpgrowthrate, dtype = float)
+    reference = float(np.mean(onlypumpgrowthrate)) if len(onlypumpgrowthrate) > 0 else 0.0
+    shifted = onlypumpgrowthrate - reference
+    sumx = np.concatenate(([0.0], np.cumsum(shifted)))
+    sumx2 = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+
+    return(reference, sumx, sumx2)
+
+
+#Sum of the squared differences between the growth rates in [lo:hi] and center, using the running sums from prefixsums()
+#lo, hi and center can be arrays to get many windows at once
+def windowdeviation(sums, lo, hi, center):
+
+    reference, sumx, sumx2 = sums
+    offset = center - reference
+    deviation = (sumx2[hi] - sumx2[lo]) - 2 * offset * (sumx[hi] - sumx[lo]) + (hi - lo) * offset * offset
+
+    return(np.maximum(deviation, 0))
+
+
+#How far apart two values from windowdeviation() can be and still be a tie
+#The running sums round differently from adding up each window, so windows with the same growth rates in them (e.g. repeated or rounded growth rates) can come out a few bits apart
+#Takes in the running sums from prefixsums()
+def windowtolerance(sums):
+
+    reference, sumx, sumx2 = sums
+    n = len(sumx) - 1
+
+    return(64 * np.finfo(float).eps * (n + 1)**1.5 * (abs(reference) + np.sqrt(max(sumx2[-1], 0)))**2)
+
+
+#The mean of the growth rates in [lo:hi] and the sum of their squared differences from it, worked out one at a time the way the window search was first written
+#Used to settle the ties that windowtolerance() can't tell apart the same way the original loops did
+def loopwindow(onlypumpgrowthrate, lo, hi):
+
+    from statistics import mean
+
+    test = [float(value) for value in onlypumpgrowthrate[lo:hi]]
+    mean_ = mean(test)
+    deviation = 0
+    for value in test:
+        deviation = deviation + (value - mean_)**2
+
+    return(mean_, deviation)
+
+
+#The basemean and baseresidual of the window centered on baseindex, worked out the way the original loops did
+def loopbase(onlypumpgrowthrate, baseindex, eithersidewindow):
+
+    basemean, deviation = loopwindow(onlypumpgrowthrate, baseindex-eithersidewindow, baseindex+eithersidewindow+1)
+
+    return(basemean, deviation / ((eithersidewindow+1)*2))
 
-                times.append(currtime)
-                onlypumpgrowthrate.append(slope)
-    
-    return (times, onlypumpgrowthrate, ax1)
+
+#Whether the growth rates in [lo:hi] go over residualallowed times the baseresidual, worked out the way the original loops did
+#Takes in the basemean and baseresidual from loopbase()
+#np.cumsum() adds one value at a time in order, so its last value is the same as the loops' running total
+def loopexceeds(onlypumpgrowthrate, lo, hi, base, residualallowed):
+
+    basemean, baseresidual = base
+    deviation = np.cumsum((np.asarray(onlypumpgrowthrate[lo:hi], dtype = float) - basemean)**2)[-1]
+
+    return(deviation / (hi - lo) > baseresidual * residualallowed)
+
+
+#Finds the first window of an expansion, from lo to hi, that goes over residualallowed times the baseresidual
+#Takes in the deviations of the windows in order (already divided by the number of growth rates) and the tolerance from windowtolerance()
+#Deviations too close to the threshold to tell apart are checked again with loopexceeds()
+#Returns the position of that window, or None if none of them go over
+def firstexceeded(onlypumpgrowthrate, lo, hi, deviation, baseindex, eithersidewindow, baseresidual, residualallowed, tolerance):
+
+    threshold = baseresidual * residualallowed
+    tolerance = tolerance * (1 + residualallowed)
+    lo, hi = np.broadcast_to(lo, deviation.shape), np.broadcast_to(hi, deviation.shape)
+    base = None
+
+    for x in np.flatnonzero(deviation > threshold - tolerance):
+        if deviation[x] <= threshold + tolerance:
+            if base is None:
+                base = loopbase(onlypumpgrowthrate, baseindex, eithersidewindow)
+            if not loopexceeds(onlypumpgrowthrate, int(lo[x]), int(hi[x]), base, residualallowed):
+                continue
+        return(int(x))
+
+    return(None)
 
 
 #Finds the residuals from the mean of a window (default window size is 11, but can be modified by user)
@@ -171,26 +661,33 @@ def pumpgrowthrates(vialOD, vialpumptimes, ax1):
 #Suffers when there is larger error in OD data for some reason
 #Takes in the times and onlypumpgrowthrate that were made above
 #Also takes in "eithersidewindow." Default is 5, calculated by taking window size, subracting 1 and then dividing by 2. Basically finding the size of the window on either side of the current value
+#Can take in sums made by prefixsums() so they can be shared between calls, otherwise makes them
+#Every window is worked out from the running sums at once, so this is linear in the number of growth rates
 #Returns baseindex, baseresidual, and basemean. These are the index at which the window centered around had the lowest residuals, the residual for that window, and the mean for that window.
-def getwindowresiduals(times, onlypumpgrowthrate, eithersidewindow):
-    
-    residuals = []
-    for x in range(eithersidewindow,len(onlypumpgrowthrate)-eithersidewindow):
-        test = onlypumpgrowthrate[x-eithersidewindow:x+eithersidewindow+1]
-        testtimes = times[x-eithersidewindow:x+eithersidewindow+1]
-
-        mean_ = mean(test)
-        deviation = 0
-        for y in range(len(test)):
-            rs = (test[y]-mean_)**2
-            deviation = deviation + rs
-
-        residuals.append(deviation)
-
-    baseindex = residuals.index(min(residuals)) + eithersidewindow
-    baseresidual = min(residuals) / ((eithersidewindow+1)*2)
-    basemean = mean(onlypumpgrowthrate[baseindex-eithersidewindow:baseindex+eithersidewindow+1])
-    
+def getwindowresiduals(times, onlypumpgrowthrate, eithersidewindow, sums = None):
+
+    if sums is None:
+        sums = prefixsums(onlypumpgrowthrate)
+
+    windowsize = 2 * eithersidewindow + 1
+    lo = np.arange(0, max(len(onlypumpgrowthrate) - 2 * eithersidewindow, 0))
+    hi = lo + windowsize
+    means = sums[0] + (sums[1][hi] - sums[1][lo]) / windowsize
+    residuals = windowdeviation(sums, lo, hi, means)
+
+    #Windows that tie with the lowest are compared the way the original loops did, which keeps the first of the lowest
+    tied = np.flatnonzero(residuals <= np.min(residuals) + 2 * windowtolerance(sums))
+    if len(tied) > 1:
+        exact = [loopwindow(onlypumpgrowthrate, x, x + windowsize) for x in tied]
+        best = min(range(len(tied)), key = lambda x: exact[x][1])
+        baseindex = int(tied[best]) + eithersidewindow
+        basemean, baseresidual = exact[best][0], exact[best][1] / ((eithersidewindow+1)*2)
+    else:
+        best = int(tied[0])
+        baseindex = best + eithersidewindow
+        baseresidual = residuals[best] / ((eithersidewindow+1)*2)
+        basemean = means[best]
+
     return(baseindex, baseresidual, basemean)
 
 
@@ -198,30 +695,25 @@ def getwindowresiduals(times, onlypumpgrowthrate, eithersidewindow):
 #Takes in the onlypumpgrowthrate and times arrays made in pumpgrowthrates()
 #Takes in baseindex, basemean, and baseresidual made in getwindowresiduals()
 #Takes in residualallowed and eithersidewindow. These can be user defined, but both default to 5 on the first iteration.
+#Can take in sums made by prefixsums() so they can be shared between calls, otherwise makes them
 #Reuturns the index relative to baseindex at which including the next growth rate would add more than "residualallowed" (5 default) times the baseresidual. Residuals are all normalized to number of data points included
 #Returns index second before last relative to baseindex if it goes until the end and never exceeds residualallowed*baseresidual.
-def expandright(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow):
-    checkone = 0
-    residuals = []
-    for x in range(eithersidewindow+1,len(onlypumpgrowthrate[baseindex:])-eithersidewindow):
-        test = onlypumpgrowthrate[baseindex-eithersidewindow:baseindex+x]
-        testtimes = times[baseindex-eithersidewindow:baseindex+x]
-
-        deviation = 0
-        for y in range(len(test)):
-            rs = (test[y]-basemean)**2
-            deviation = deviation + rs
-
-        deviation = deviation/len(test)
-        residuals.append(deviation)
-        if deviation > baseresidual * residualallowed:
-            stop = x - 2
-            checkone = 1
-            break
-            
-    if checkone == 0:
+def expandright(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow, sums = None):
+
+    if sums is None:
+        sums = prefixsums(onlypumpgrowthrate)
+
+    #Window x covers onlypumpgrowthrate[baseindex-eithersidewindow:baseindex+x]
+    x = np.arange(eithersidewindow+1, len(onlypumpgrowthrate) - baseindex - eithersidewindow)
+    deviation = windowdeviation(sums, baseindex - eithersidewindow, baseindex + x, basemean) / (x + eithersidewindow)
+
+    exceeded = firstexceeded(onlypumpgrowthrate, baseindex - eithersidewindow, baseindex + x, deviation, baseindex, eithersidewindow, baseresidual, residualallowed, windowtolerance(sums))
+    countstat('window expansion iterations', exceeded + 1 if exceeded is not None else len(x))
+    if exceeded is not None:
+        stop = int(x[exceeded]) - 2
+    else:
         stop = len(onlypumpgrowthrate) - baseindex - 2
-            
+
     return(stop)
 
 
@@ -229,55 +721,1609 @@ def expandright(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, re
 #Takes in the onlypumpgrowthrate and times arrays made in pumpgrowthrates()
 #Takes in baseindex, basemean, and baseresidual made in getwindowresiduals()
 #Takes in residualallowed and eithersidewindow. These can be user defined, but both default to 5 on the first iteration.
+#Can take in sums made by prefixsums() so they can be shared between calls, otherwise makes them
 #Reuturns the index relative to baseindex at which including the next growth rate would add more than "residualallowed" (5 default) times the baseresidual. Residuals are all normalized to number of data points included
 #Returns index second after first relative to baseindex if it goes until the end and never exceeds residualallowed*baseresidual.
-def expandleft(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow):
-    checktwo = 0
-    residuals = []
-    for x in range(eithersidewindow+1,len(onlypumpgrowthrate[:baseindex])):
-        test = onlypumpgrowthrate[baseindex-x:baseindex+eithersidewindow]
-        testtimes = onlypumpgrowthrate[baseindex-x:baseindex+eithersidewindow]
-
-        deviation = 0
-        for y in range(len(test)):
-            rs = (test[y]-basemean)**2
-            deviation = deviation + rs
-
-        deviation = deviation/len(test)
-        residuals.append(deviation)
-        if deviation > baseresidual * residualallowed:
-            begin = x - 1
-            checktwo = 1
-            break
-            
-    if checktwo == 0:
+def expandleft(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow, sums = None):
+
+    if sums is None:
+        sums = prefixsums(onlypumpgrowthrate)
+
+    #Window x covers onlypumpgrowthrate[baseindex-x:baseindex+eithersidewindow]
+    x = np.arange(eithersidewindow+1, baseindex)
+    deviation = windowdeviation(sums, baseindex - x, baseindex + eithersidewindow, basemean) / (x + eithersidewindow)
+
+    exceeded = firstexceeded(onlypumpgrowthrate, baseindex - x, baseindex + eithersidewindow, deviation, baseindex, eithersidewindow, baseresidual, residualallowed, windowtolerance(sums))
+    countstat('window expansion iterations', exceeded + 1 if exceeded is not None else len(x))
+    if exceeded is not None:
+        begin = int(x[exceeded]) - 1
+    else:
         begin = baseindex - 2
-    
+
     return(begin)
 
 
+#Runs the whole window search (getwindowresiduals(), expandright() and expandleft()) with one set of analysis parameters
+#Takes in the times and onlypumpgrowthrate arrays made in pumpgrowthrates() and the three analysis parameters
+#Returns baseindex, begin and stop, or None if there are not enough pump events to be confident in the growth rates (or not enough growth rates to fill one window)
+def findwindow(times, onlypumpgrowthrate, minimumpumpsrequired, windowsize, residualallowed):
+
+    if len(onlypumpgrowthrate) <= minimumpumpsrequired or len(onlypumpgrowthrate) < windowsize:
+        return(None)
+
+    #Converts the window size into how far it goes in either direction (minus the base position)
+    eithersidewindow = int((windowsize - 1) / 2)
+
+    sums = prefixsums(onlypumpgrowthrate)
+    baseindex, baseresidual, basemean = getwindowresiduals(times, onlypumpgrowthrate, eithersidewindow, sums)
+    stop = expandright(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow, sums)
+    begin = expandleft(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow, sums)
+
+    return(baseindex, begin, stop)
+
+
+#Makes the row of the output CSV for one sample
+#Takes in the sample name, the growth rates, the start and stop indeces of the window and whatever settings should be recorded after the statistics
+#Returns the row as a list
+def summarydata(samplename, onlypumpgrowthrate, startindex, stopindex, *settings):
+
+    window = onlypumpgrowthrate[startindex:stopindex]
+    data = [samplename, np.median(window), np.mean(window), np.std(window), len(window), np.median(onlypumpgrowthrate), np.mean(onlypumpgrowthrate), np.std(onlypumpgrowthrate), len(onlypumpgrowthrate)]
+    data.extend(settings)
+
+    return(data)
+
+
+#Columns added to the output CSV when bootstrapping (see bootstrapvial())
+bootstrapheader = ["trimmed median CI low", "trimmed median CI high", "trimmed average CI low", "trimmed average CI high", "window start CI low (h)", "window start CI high (h)", "window end CI low (h)", "window end CI high (h)"]
+
+
+#Runs the window search (the same as findwindow()) on many series of growth rates at once, one per row of onlypumpgrowthrates
+#Every step is done for all the rows together on (rows x windows) arrays, so it costs about as much as a few calls to findwindow() no matter how many rows there are
+#Rows where windowtolerance() can't tell two windows apart, or a window from the threshold, are run again with findwindow() so that ties are settled the same way
+#Returns baseindex, begin and stop as arrays with one value per row, or None if there are not enough pump events (the same for every row, since they all have the same length)
+def findwindows(times, onlypumpgrowthrates, minimumpumpsrequired, windowsize, residualallowed):
+
+    rows, n = onlypumpgrowthrates.shape
+    if n <= minimumpumpsrequired or n < windowsize:
+        return(None)
+
+    eithersidewindow = int((windowsize - 1) / 2)
+    row = np.arange(rows)[:, None]
+
+    #The same running sums as prefixsums(), for every row
+    reference = np.mean(onlypumpgrowthrates, axis = 1)
+    shifted = onlypumpgrowthrates - reference[:, None]
+    sumx = np.concatenate((np.zeros((rows, 1)), np.cumsum(shifted, axis = 1)), axis = 1)
+    sumx2 = np.concatenate((np.zeros((rows, 1)), np.cumsum(shifted * shifted, axis = 1)), axis = 1)
+    #windowtolerance() for every row
+    tolerance = (64 * np.finfo(float).eps * (n + 1)**1.5 * (np.abs(reference) + np.sqrt(np.maximum(sumx2[:, -1], 0)))**2)[:, None]
+
+    def deviation(lo, hi, center):
+        offset = center - reference[:, None]
+        return(np.maximum((sumx2[row, hi] - sumx2[row, lo]) - 2 * offset * (sumx[row, hi] - sumx[row, lo]) + (hi - lo) * offset * offset, 0))
+
+    #getwindowresiduals()
+    lo = np.arange(0, n - 2 * eithersidewindow)[None, :]
+    means = reference[:, None] + (sumx[:, lo[0] + windowsize] - sumx[:, lo[0]]) / windowsize
+    residuals = deviation(lo, lo + windowsize, means)
+    best = np.argmin(residuals, axis = 1)
+    tied = np.count_nonzero(residuals <= residuals[np.arange(rows), best][:, None] + 2 * tolerance, axis = 1) > 1
+    baseindex = best + eithersidewindow
+    baseresidual = residuals[np.arange(rows), best] / ((eithersidewindow+1)*2)
+    basemean = means[np.arange(rows), best][:, None]
+
+    #expandright(), with the windows that go past the end of a row ignored
+    x = np.arange(eithersidewindow+1, n - 2 * eithersidewindow)[None, :]
+    inside = x < (n - baseindex - eithersidewindow)[:, None]
+    hi = np.minimum(baseindex[:, None] + x, n)
+    over = deviation((baseindex - eithersidewindow)[:, None], hi, basemean) / (x + eithersidewindow) - (baseresidual * residualallowed)[:, None]
+    exceeded = inside & (over > 0)
+    first = np.where(exceeded.any(axis = 1), np.argmax(exceeded, axis = 1) if x.size else 0, x.shape[1])
+    tied |= (inside & (np.abs(over) <= tolerance * (1 + residualallowed)) & (np.arange(x.shape[1]) <= first[:, None])).any(axis = 1)
+    stop = np.where(exceeded.any(axis = 1), x[0, np.argmax(exceeded, axis = 1)] - 2 if x.size else 0, n - baseindex - 2)
+
+    #expandleft()
+    x = np.arange(eithersidewindow+1, n - 1 - eithersidewindow)[None, :]
+    inside = x < baseindex[:, None]
+    lo = np.maximum(baseindex[:, None] - x, 0)
+    over = deviation(lo, (baseindex + eithersidewindow)[:, None], basemean) / (x + eithersidewindow) - (baseresidual * residualallowed)[:, None]
+    exceeded = inside & (over > 0)
+    first = np.where(exceeded.any(axis = 1), np.argmax(exceeded, axis = 1) if x.size else 0, x.shape[1])
+    tied |= (inside & (np.abs(over) <= tolerance * (1 + residualallowed)) & (np.arange(x.shape[1]) <= first[:, None])).any(axis = 1)
+    begin = np.where(exceeded.any(axis = 1), x[0, np.argmax(exceeded, axis = 1)] - 1 if x.size else 0, baseindex - 2)
+
+    for z in np.flatnonzero(tied):
+        baseindex[z], begin[z], stop[z] = findwindow(times, onlypumpgrowthrates[z], minimumpumpsrequired, windowsize, residualallowed)
+
+    return(baseindex, begin, stop)
+
+
+#Makes new sets of section slopes by resampling the ln(OD) residuals within each section between pumps
+#Every resampled point is the section's fitted line plus the residual of a random point from the same section
+#Since the fitted lines don't change, each new slope is the old one plus the slope of the resampled residuals, and all the resamples are fitted at once with one bincount per sum
+#Takes in what segmentfits() returns (minus the times), the number of resamples and a numpy random Generator
+#Returns the slopes as a (resamples x sections) array
+def residualresamples(t, y, starts, ends, slopes, intercepts, resamples, rng):
+
+    nsegments = len(ends)
+    counts = ends - starts
+    segid, index = segmentindex(starts, ends)
+
+    tt = t[index] - t[starts[segid]]
+    residuals = y[index] - (intercepts[segid] + slopes[segid] * tt)
+
+    #Position of each point within index, and a random point of the same section for every resample
+    first = np.concatenate(([0], np.cumsum(counts)))[:-1][segid]
+    drawn = residuals[first + (rng.random((resamples, len(index))) * counts[segid]).astype(int)]
+
+    group = (np.arange(resamples)[:, None] * nsegments + segid).ravel()
+    n = counts.astype(float)
+    st = np.bincount(segid, weights = tt, minlength = nsegments)
+    stt = np.bincount(segid, weights = tt * tt, minlength = nsegments)
+    sr = np.bincount(group, weights = drawn.ravel(), minlength = resamples * nsegments).reshape(resamples, nsegments)
+    str_ = np.bincount(group, weights = (drawn * tt).ravel(), minlength = resamples * nsegments).reshape(resamples, nsegments)
+
+    denominator = n * stt - st * st
+    change = np.divide(n * str_ - st * sr, denominator, out = np.zeros((resamples, nsegments)), where = denominator != 0)
+
+    return(slopes + change)
+
+
+#Bootstrap confidence intervals for one vial, done in chunks of resamples so that no array has more than about chunk numbers in it
+#Without residuals, the growth rates inside the window that was found are resampled, giving intervals for the trimmed median and average only
+#With residuals, the ln(OD) residuals within each section are resampled (residualresamples()) and the window search is run again on every resample (findwindows()), which also gives intervals for the times the window starts and ends
+#Takes in what segmentfits() returns, the growth rates the window was found in and the window from findwindow(), the three analysis parameters, and the bootstrap settings
+#Returns the values for the bootstrapheader columns (NaN where they don't apply)
+def bootstrapvial(fits, growthtimes, growthrates, window, minimumpumpsrequired, windowsize, residualallowed, resamples = 1000, residuals = False, confidence = 0.95, chunk = 2**22, seed = 0):
+
+    t, y, starts, ends, times, onlypumpgrowthrate, intercepts = fits
+    rng = np.random.default_rng(seed)
+    quantiles = [50 * (1 - confidence), 50 * (1 + confidence)]
+    medians, means, windowstarts, windowends = [], [], [], []
+    baseindex, begin, stop = window
+
+    if not residuals:
+        trimmed = np.asarray(growthrates[baseindex-begin:baseindex+stop])
+        step = max(1, chunk // max(len(trimmed), 1))
+        for done in range(0, resamples, step):
+            drawn = trimmed[rng.integers(0, len(trimmed), (min(step, resamples - done), len(trimmed)))]
+            medians.append(np.median(drawn, axis = 1))
+            means.append(np.mean(drawn, axis = 1))
+        return(list(np.nanpercentile(np.concatenate(medians), quantiles)) + list(np.nanpercentile(np.concatenate(means), quantiles)) + [np.nan]*4)
+
+    step = max(1, chunk // max(len(t), 1))
+    for done in range(0, resamples, step):
+        resampled = residualresamples(t, y, starts, ends, onlypumpgrowthrate, intercepts, min(step, resamples - done), rng)
+        windows = findwindows(times, resampled, minimumpumpsrequired, windowsize, residualallowed)
+        if windows is None:
+            break
+        startindex = np.clip(windows[0] - windows[1], 0, len(times) - 1)
+        stopindex = np.clip(windows[0] + windows[2], startindex + 1, len(times))
+        position = np.arange(len(times))[None, :]
+        trimmed = np.where((position >= startindex[:, None]) & (position < stopindex[:, None]), resampled, np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            medians.append(np.nanmedian(trimmed, axis = 1))
+            means.append(np.nanmean(trimmed, axis = 1))
+        windowstarts.append(times[startindex])
+        windowends.append(times[stopindex - 1])
+
+    if not medians:
+        return([np.nan]*8)
+
+    return([x for values in (medians, means, windowstarts, windowends) for x in np.nanpercentile(np.concatenate(values), quantiles)])
+
+
 #Finds indeces corresponding with times at which the user would like the fit to occur
 #Takes in the desired start and stop times (user defined)
-#Takes in the times array
-#Returns indeces corresponding with start and stop times in times array
+#Takes in the times array (in order)
+#Uses bisect, so it only looks at about log2(len(times)) of the times
+#Returns indeces corresponding with start and stop times in times array: startindex is the first time at or after start, stopindex is the first time after stop (or the last time if none are after stop)
 def fittingbyself(start, stop, times):
-    x = 0
-    check = False
-    while x < len(times) and check == False:
-        if times[x] < start:
-            startindex = copy(x) + 1
-        if times[x] > stop:
-            stopindex = copy(x)
-            check = True
-        if x == len(times) - 1:
-            stopindex = copy(x)
-            check = True
-        x = x + 1
-    
+
+    stopindex = min(bisect_right(times, stop), len(times) - 1)
+    startindex = min(bisect_left(times, start), stopindex + 1)
+
     return(startindex, stopindex)
-            
-        
-        
+
+
+#Picks which points to graph so that the shape of the trace is kept with far fewer points
+#Splits the time axis into "buckets" columns (about one per pixel) and keeps the lowest and highest point in each
+#Takes in the times (in order) and values
+#Returns the indeces of the points to keep, in order
+def downsample(x, y, buckets):
+
+    if len(x) <= 2 * buckets:
+        return(np.arange(len(x)))
+
+    span = x[-1] - x[0]
+    bucket = np.minimum(((x - x[0]) / span * buckets).astype(int), buckets - 1) if span > 0 else np.zeros(len(x), dtype = int)
+    order = np.lexsort((y, bucket))
+    first = np.flatnonzero(np.concatenate(([True], bucket[order][1:] != bucket[order][:-1])))
+    last = np.concatenate((first[1:] - 1, [len(order) - 1]))
+
+    return(np.unique(np.concatenate((order[first], order[last]))))
+
+
+#Gets what is needed to graph the ln(OD600)s and the fits between each pump event, with the points downsampled by downsample()
+#Takes in what segmentfits() returns (except the section times) and the number of buckets to downsample to
+#Returns the downsampled times, ln(OD)s and section numbers of the points, and the start and end of each fit line
+def vialplotdata(t, y, starts, ends, onlypumpgrowthrate, intercepts, buckets = 1000):
+
+    segid, index = segmentindex(starts, ends)
+    kept = downsample(t[index], y[index], buckets)
+    keep = index[kept]
+
+    fitted = ends > starts
+    xstart = t[starts[fitted]]
+    xstop = t[ends[fitted] - 1]
+    lines = np.stack([np.column_stack([xstart, intercepts[fitted]]), np.column_stack([xstop, intercepts[fitted] + onlypumpgrowthrate[fitted] * (xstop - xstart)])], axis = 1)
+
+    return(t[keep], y[keep], segid[kept], lines)
+
+
+#Graphs the ln(OD600)s and the fits between each pump event onto ax1
+#Every section gets the next color in the cycle, same as scattering each section on its own
+def drawOD(ax1, plotdata):
+
+    import matplotlib
+    from matplotlib.collections import LineCollection
+
+    pointtimes, pointlnod, pointsegment, lines = plotdata
+    colors = np.array(matplotlib.rcParams['axes.prop_cycle'].by_key()['color'])
+    ax1.scatter(pointtimes, pointlnod, c = colors[pointsegment % len(colors)])
+    ax1.add_collection(LineCollection(lines, colors = 'k'))
+
+
+#Graphs the growth rates onto ax2, with lines at the start and end of the window if there is one
+#windowlines is the indeces in times of the start and end of the window, or None
+def drawgrowthrates(ax2, times, onlypumpgrowthrate, windowlines):
+
+    ax2.scatter(times, onlypumpgrowthrate)
+    if windowlines is not None:
+        ax2.axvline(x = times[windowlines[1]])
+        ax2.axvline(x = times[windowlines[0]])
+
+
+#Finishing touches on graphs
+def finishfigure(fig, ax1, ax2, samplename):
+
+    fig.suptitle(samplename, fontsize = 20)
+    ax1.set(ylabel = 'Natural log of OD 600')
+    ax2.set(xlabel = 'Time (h)', ylabel = 'Specific growth rate (h^-1)')
+    fig.tight_layout()
+
+
+#Hash of this script's source, so that cached results are remade whenever the code changes
+_codeversion = None
+
+
+def codeversion():
+
+    global _codeversion
+    if _codeversion is None:
+        with open(os.path.abspath(__file__), 'rb') as scriptfile:
+            _codeversion = hashlib.sha256(scriptfile.read()).hexdigest()
+
+    return(_codeversion)
+
+
+#Cache of the results of each stage of the analysis after parsing: section fits, then the window, then the figure
+#The parsed arrays aren't kept here, since loadvialfile() already keeps them in its sidecars next to the files
+#Every result is stored under a hash of what it was made from (the hash of the input files or of the earlier result's key, the parameters and the code version), so a result is only remade when something it depends on changed
+#e.g. changing residualallowed only redoes the window and the figure, not the fits
+#Results that are used are marked as recently used, and evict() deletes the least recently used ones once the cache is over maxbytes
+#With rebuild, nothing is read from the cache but everything is still saved to it
+class ArtifactCache:
+
+    def __init__(self, root, maxbytes = 1024**3, rebuild = False):
+        self.root = root
+        self.maxbytes = maxbytes
+        self.rebuild = rebuild
+
+    #Hash of a file's contents
+    def filehash(self, path):
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as datafile:
+            for block in iter(lambda: datafile.read(1 << 20), b''):
+                digest.update(block)
+
+        return(digest.hexdigest())
+
+    #Key of a result made from the given parts (hashes, parameters, ...) by the current code
+    def key(self, *parts):
+
+        return(hashlib.sha256(json.dumps([codeversion()] + list(parts)).encode()).hexdigest())
+
+    def path(self, key, suffix):
+
+        return(os.path.join(self.root, key[:2], key + suffix))
+
+    #Returns the path of the result, or None if it isn't cached
+    def get(self, key, suffix):
+
+        path = self.path(key, suffix)
+        if not self.rebuild:
+            try:
+                os.utime(path)
+                countstat('cache hits')
+                return(path)
+            except FileNotFoundError:
+                pass
+        countstat('cache misses')
+
+        return(None)
+
+    #Saves a result by calling write() with a binary file to write it to
+    #Returns the path of the result
+    def put(self, key, suffix, write):
+
+        path = self.path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        temporary = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'wb') as artifactfile:
+            write(artifactfile)
+        os.replace(temporary, path)
+
+        return(path)
+
+    #Deletes the least recently used results until the cache is no bigger than maxbytes
+    def evict(self):
+
+        artifacts = []
+        for directory, subdirectories, filenames in os.walk(self.root):
+            for filename in filenames:
+                try:
+                    status = os.stat(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    continue
+                artifacts.append((status.st_mtime_ns, status.st_size, os.path.join(directory, filename)))
+
+        total = sum(size for used, size, path in artifacts)
+        for used, size, path in sorted(artifacts):
+            if total <= self.maxbytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total = total - size
+
+
+#Loads one vial's files (through loadvialfile() and its sidecars) and fits every section between pumping events, using the cache for the fits if there is one
+#Returns what segmentfits() returns and the key of the fits in the cache (None without a cache)
+def loadandfit(datadir, vialnum, cache = None):
+
+    if cache is not None:
+        with timed('hash inputs'):
+            odkey = cache.key('OD', cache.filehash(os.path.join(datadir, 'vial'+str(vialnum)+'_OD.txt')))
+            pumpkey = cache.key('pump times', cache.filehash(os.path.join(datadir, 'vial'+str(vialnum)+'_pump_log.txt')))
+            segmentkey = cache.key('segment fits', odkey, pumpkey)
+
+        cached = cache.get(segmentkey, '.npz')
+        if cached is not None:
+            with timed('segment fits'):
+                with np.load(cached) as artifact:
+                    fits = tuple(artifact['arr_'+str(x)] for x in range(7))
+            return(fits, segmentkey)
+
+    with timed('load'):
+        vial = Vial.load(vialnum, datadir)
+    with timed('segment fits'):
+        fits = segmentfits(vial)
+
+    if cache is None:
+        return(fits, None)
+
+    cache.put(segmentkey, '.npz', lambda artifactfile: np.savez(artifactfile, *fits))
+
+    return(fits, segmentkey)
+
+
+#Runs findwindow(), using the cache if there is one
+#Takes in the key of the fits from loadandfit() (ignored without a cache), the growth rates, the three analysis parameters and anything else the growth rates were made with (e.g. the estimator)
+#Returns what findwindow() returns and the key of the window in the cache (None without a cache)
+def cachedfindwindow(cache, segmentkey, times, onlypumpgrowthrate, minimumpumpsrequired, windowsize, residualallowed, *estimated):
+
+    if cache is None:
+        return(findwindow(times, onlypumpgrowthrate, minimumpumpsrequired, windowsize, residualallowed), None)
+
+    #The parameters are normalized first so that e.g. 5 from a config file and 5.0 from the command line share a key
+    windowkey = cache.key('window', segmentkey, int(minimumpumpsrequired), int(windowsize), float(residualallowed), *estimated)
+    cached = cache.get(windowkey, '.json')
+    if cached is not None:
+        with open(cached) as artifactfile:
+            window = json.load(artifactfile)
+        return(None if window is None else tuple(window), windowkey)
+
+    window = findwindow(times, onlypumpgrowthrate, minimumpumpsrequired, windowsize, residualallowed)
+    cache.put(windowkey, '.json', lambda artifactfile: artifactfile.write(json.dumps(window).encode()))
+
+    return(window, windowkey)
+
+
+#Makes and saves the figure for one vial on the Agg backend, without pyplot, so it can be done in a worker process and nothing is kept around afterwards
+#Takes in the file name, the sample name, the plot data from vialplotdata() and the growth rates and window lines for drawgrowthrates()
+#If a cache and key are given, the figure is also saved in the cache
+#matplotlib is only imported here and in the other drawing functions, so runs without figures never load it
+def savevialfigure(filename, samplename, plotdata, times, onlypumpgrowthrate, windowlines, cache = None, figurekey = None):
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    with timed('drawing'):
+        fig = Figure(figsize = (10,10))
+        FigureCanvasAgg(fig)
+        ax1, ax2 = fig.subplots(2, sharex = True)
+        drawOD(ax1, plotdata)
+        drawgrowthrates(ax2, times, onlypumpgrowthrate, windowlines)
+        finishfigure(fig, ax1, ax2, samplename)
+    with timed('savefig'):
+        fig.savefig(filename, bbox_inches = 'tight', facecolor = 'white')
+    fig.clear()
+
+    if cache is not None:
+        with open(filename, 'rb') as figurefile:
+            cache.put(figurekey, '.png', lambda artifactfile: shutil.copyfileobj(figurefile, artifactfile))
+
+
+#Analyzes one vial without asking anything, the same way main() does when the graphs are not being checked
+#Takes in the directory with the vial's files, the vial number, the sample name and the three analysis parameters
+#Takes in an ArtifactCache to only redo the stages whose inputs changed, or None
+#estimator picks where the growth rates come from: "segments" (one per section between pumps), "rolling" (rollinggrowthrates() with rollingwindow, e.g. "2h" or "25" points) or "auto" (rolling only when there are not enough pump events)
+#If bootstrap is more than 0, that many resamples are made by bootstrapvial() and the confidence intervals are added to the end of the row (residual resampling only applies to growth rates from the sections between pumps)
+#Returns the row for the output CSV, the arguments for savevialfigure() to graph the vial next to its files (None if plot is False, or if the figure was already in the cache and has just been copied there), and the times and growth rates the window was found in
+def analyzevial(datadir, vialnum, samplename, minimumpumpsrequired = 10, windowsize = 11, residualallowed = 5, plot = True, cache = None, estimator = 'segments', rollingwindow = '1h', bootstrap = 0, bootstrapresiduals = False, confidence = 0.95, bootstrapchunk = 2**22):
+
+    fits, segmentkey = loadandfit(datadir, vialnum, cache)
+    t, y, starts, ends, times, onlypumpgrowthrate, intercepts = fits
+
+    growthtimes, growthrates = times, onlypumpgrowthrate
+    estimated = ('segments',)
+    pumpmasked = 0
+    if estimator == 'rolling' or (estimator == 'auto' and len(onlypumpgrowthrate) <= minimumpumpsrequired):
+        with timed('rolling regression'):
+            #The first points after each pump (the point before every section and the end of the last section if it isn't the end of the run) mask the same windows as the pump times
+            growthtimes, growthrates, pumpmasked = rollinggrowthrates(t, y, t[np.union1d(starts[starts > 0] - 1, ends[ends < len(t)])], *parserollingwindow(rollingwindow))
+        estimated = ('rolling', rollingwindow)
+        if estimator == 'auto':
+            print('Vial'+str(vialnum)+' had too few pump events, so its growth rates come from a rolling regression over '+str(rollingwindow)+'.')
+
+    with timed('window search'):
+        window, windowkey = cachedfindwindow(cache, segmentkey, growthtimes, growthrates, minimumpumpsrequired, windowsize, residualallowed, *estimated)
+    if window is not None:
+        baseindex, begin, stop = window
+        windowlines = (baseindex-begin, baseindex+stop)
+        data = summarydata(samplename, growthrates, baseindex-begin, baseindex+stop, minimumpumpsrequired, windowsize, residualallowed)
+        if bootstrap > 0:
+            with timed('bootstrap'):
+                data.extend(bootstrapvial(fits, growthtimes, growthrates, window, minimumpumpsrequired, windowsize, residualallowed, bootstrap, bootstrapresiduals and estimated[0] == 'segments', confidence, bootstrapchunk, vialnum))
+    else:
+        windowlines = None
+        data = [samplename, np.nan, np.nan, np.nan, np.nan]
+        if pumpmasked > 0:
+            print('Vial'+str(vialnum)+' failed analysis because '+str(pumpmasked)+' of the rolling regression windows over '+str(rollingwindow)+' had a pump in them, leaving '+str(len(growthrates))+'. Use a shorter --rolling-window or --estimator segments.')
+        else:
+            print('Vial'+str(vialnum)+' failed analysis because it had too few data points.')
+
+    plotjob = None
+    if plot:
+        filename = os.path.join(datadir, 'vial'+str(vialnum)+'_'+slugify(samplename)+'.png')
+        figurekey = None
+        if cache is not None:
+            figurekey = cache.key('figure', windowkey, samplename)
+            cached = cache.get(figurekey, '.png')
+            if cached is not None:
+                shutil.copyfile(cached, filename)
+                return(data, None, (growthtimes, growthrates))
+        with timed('plot data'):
+            plotjob = (filename, samplename, vialplotdata(t, y, starts, ends, onlypumpgrowthrate, intercepts), growthtimes, growthrates, windowlines, cache, figurekey)
+
+    return(data, plotjob, (growthtimes, growthrates))
+
+
+#Saves the rows made for each sample as the output CSV
+#Takes in the output file name (including .csv), the rows and the names of any columns added after the settings (e.g. bootstrapheader)
+def writesampledata(outputfilename, sampledata, extracolumns = ()):
+
+    with open(outputfilename, 'w', newline = '') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["sample name", "trimmed median", "trimmed average", "trimmed standard deviaiton", "# of cycles included", "untrimmed median", "untrimmed average", "untrimmed standard deviation", "total # of cycles in run", "Minimum pump events required", "Initial window size", "Residuals allowed"] + list(extracolumns))
+        for z in range(len(sampledata)):
+            writer.writerow(sampledata[z])
+
+
+#Reads a number given on the command line, keeping whole numbers as ints so they are saved the same way main() saves them (5, not 5.0)
+def parsenumber(text):
+
+    value = float(text)
+
+    return(int(value) if value.is_integer() else value)
+
+
+#Reads the vial to sample name map given on the command line, e.g. 0=1270.1,1=1270.2
+#Returns a dictionary with the vial numbers as keys
+def parsevialmap(text):
+
+    vials = {}
+    for pair in text.split(','):
+        vialnum, samplename = pair.split('=', 1)
+        vials[int(vialnum)] = samplename
+
+    return(vials)
+
+
+#Append-only SQLite database of every vial that has been analyzed, so past runs can be compared without finding and re-reading their output CSVs
+#Each analysis of a vial is one row with the experiment name and start date from the OD file header, the vial, the sample name, the parameters, the output CSV row and the growth rates (times and rates as float64 bytes)
+#Indexed by sample name and date, and by experiment and vial, so a query for one sample or one experiment only reads its own rows
+class ResultsStore:
+
+    summarycolumns = ['trimmedmedian', 'trimmedaverage', 'trimmedstd', 'cyclesincluded', 'untrimmedmedian', 'untrimmedaverage', 'untrimmedstd', 'totalcycles']
+    settingcolumns = ['minimumpumpsrequired', 'windowsize', 'residualallowed', 'estimator', 'rollingwindow']
+    csvheader = ['recorded', 'experiment', 'date', 'data directory', 'vial', 'sample name', 'trimmed median', 'trimmed average', 'trimmed standard deviation', '# of cycles included', 'untrimmed median', 'untrimmed average', 'untrimmed standard deviation', 'total # of cycles in run', 'Minimum pump events required', 'Initial window size', 'Residuals allowed', 'estimator', 'rolling window', 'code version']
+
+    def __init__(self, path):
+
+        import sqlite3
+
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout = 60)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, recorded TEXT NOT NULL, experiment TEXT, date TEXT, datadir TEXT, vial INTEGER, sample TEXT, '
+                + ', '.join(column+(' INTEGER' if 'cycles' in column else ' REAL') for column in self.summarycolumns) + ', minimumpumpsrequired INTEGER, windowsize INTEGER, residualallowed REAL, estimator TEXT, rollingwindow TEXT, codeversion TEXT, times BLOB, growthrates BLOB)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS runsbysample ON runs (sample, date)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS runsbyexperiment ON runs (experiment, vial, date)')
+
+    def close(self):
+        self.connection.close()
+
+    #Adds one row per vial, all in one transaction
+    #Takes in (data directory, vial number, output CSV row, settings dictionary, times, growth rates) for each vial
+    #The date is the start of the run from the OD file header, or the file's modification time if the header doesn't have one
+    def add(self, runs):
+
+        recorded = datetime.now().isoformat(timespec = 'seconds')
+        version = codeversion()
+        rows = []
+        for datadir, vialnum, data, settings, times, growthrates in runs:
+            odpath = os.path.join(datadir, 'vial'+str(vialnum)+'_OD.txt')
+            with open(odpath) as odfile:
+                header = parseheader(odfile.readline())
+            date = header['start'] or datetime.fromtimestamp(os.path.getmtime(odpath)).isoformat(timespec = 'seconds')
+            summary = [None if x is None or x != x else (int if 'cycles' in column else float)(x) for column, x in zip(self.summarycolumns, list(data[1:9]) + [None]*8)]
+            rows.append([recorded, header['experiment'], date, os.path.abspath(datadir), vialnum, data[0]] + summary + [settings.get(column) for column in self.settingcolumns]
+                + [version, np.ascontiguousarray(times, dtype = np.float64).tobytes(), np.ascontiguousarray(growthrates, dtype = np.float64).tobytes()])
+
+        if rows:
+            with self.connection:
+                self.connection.executemany('INSERT INTO runs (recorded, experiment, date, datadir, vial, sample, ' + ', '.join(self.summarycolumns + self.settingcolumns)
+                    + ', codeversion, times, growthrates) VALUES (' + ', '.join(['?'] * len(rows[0])) + ')', rows)
+
+    #Finds the runs matching every criterion given (sample name, experiment name, vial number, and dates as ISO strings, e.g. 2023-09-25)
+    #Returns a list of dictionaries, oldest run first, with the times and growth rates as arrays if series is True
+    def query(self, sample = None, experiment = None, vial = None, since = None, until = None, series = False):
+
+        conditions, values = [], []
+        for condition, value in (('sample = ?', sample), ('experiment = ?', experiment), ('vial = ?', vial), ('date >= ?', since), ('date < ?', until)):
+            if value is not None:
+                conditions.append(condition)
+                values.append(value)
+
+        columns = '*' if series else 'id, recorded, experiment, date, datadir, vial, sample, ' + ', '.join(self.summarycolumns + self.settingcolumns) + ', codeversion'
+        cursor = self.connection.execute('SELECT ' + columns + ' FROM runs' + (' WHERE ' + ' AND '.join(conditions) if conditions else '') + ' ORDER BY date, id', values)
+
+        runs = []
+        for row in cursor:
+            run = dict(row)
+            if series:
+                run['times'] = np.frombuffer(run['times'], dtype = np.float64)
+                run['growthrates'] = np.frombuffer(run['growthrates'], dtype = np.float64)
+            runs.append(run)
+
+        return(runs)
+
+    #Saves runs from query() as a CSV, with the same statistics as the output CSV
+    def export(self, outputfilename, runs):
+
+        with open(outputfilename, 'w', newline = '') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(self.csvheader)
+            for run in runs:
+                writer.writerow([run['recorded'], run['experiment'], run['date'], run['datadir'], run['vial'], run['sample']] + [run[column] for column in self.summarycolumns + self.settingcolumns] + [run['codeversion']])
+
+
+#Analyzes every vial in the vials dictionary (vial number: sample name) on a pool of worker processes and saves the output CSV
+#The rows are saved in the order of the vials dictionary no matter which vial finishes first
+#The figures are only drawn once the CSV has been saved, on the same pool, and not at all if plots is False
+#If statsfilename is given, the stage timings and counters of each vial (see instrumented()) are saved there as JSON lines, followed by a line for the whole batch
+#If profilevial is given, a cProfile dump of that vial's analysis is saved next to the output CSV
+#If a cache (ArtifactCache) is given, only the stages whose inputs changed are redone, and the least recently used results are evicted at the end
+#estimator and rollingwindow are passed on to analyzevial()
+#If a store (ResultsStore) is given, every vial's row, growth rates and parameters are added to it
+#If bootstrap is more than 0, the confidence intervals from bootstrapvial() are added as extra columns (bootstrapsettings are the rest of its settings: residuals, confidence and chunk)
+#Returns the rows
+def runbatch(datadir, vials, outputfilename, minimumpumpsrequired = 10, windowsize = 11, residualallowed = 5, workers = None, plots = True, statsfilename = None, profilevial = None, cache = None, estimator = 'segments', rollingwindow = '1h', store = None, bootstrap = 0, bootstrapsettings = (False, 0.95, 2**22)):
+
+    started = time.perf_counter()
+    instrument = statsfilename is not None
+    vialnums = list(vials)
+    n = len(vialnums)
+    profilefilenames = [os.path.splitext(outputfilename)[0]+'.vial'+str(z)+'.prof' if z == profilevial else None for z in vialnums]
+    arguments = [[instrument]*n, profilefilenames, [analyzevial]*n, [datadir]*n, vialnums, [vials[z] for z in vialnums], [minimumpumpsrequired]*n, [windowsize]*n, [residualallowed]*n, [plots]*n, [cache]*n, [estimator]*n, [rollingwindow]*n, [bootstrap]*n] + [[setting]*n for setting in bootstrapsettings]
+
+    executor = None
+    if not (workers == 1 or n <= 1):
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers = workers)
+    try:
+        results = list((executor.map if executor is not None else map)(instrumented, *arguments))
+        sampledata = [data for (data, plotjob, series), stats in results]
+
+        csvstarted = time.perf_counter()
+        writesampledata(outputfilename, sampledata, bootstrapheader if bootstrap > 0 else ())
+        csvseconds = time.perf_counter() - csvstarted
+
+        plotjobs = [(index, plotjob) for index, ((data, plotjob, series), stats) in enumerate(results) if plotjob is not None]
+        if executor is not None:
+            plotting = [(index, executor.submit(instrumented, instrument, None, savevialfigure, *plotjob)) for index, plotjob in plotjobs]
+            plotstats = [(index, future.result()[1]) for index, future in plotting]
+        else:
+            plotstats = [(index, instrumented(instrument, None, savevialfigure, *plotjob)[1]) for index, plotjob in plotjobs]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if cache is not None:
+        cache.evict()
+
+    if store is not None:
+        settings = {'minimumpumpsrequired': minimumpumpsrequired, 'windowsize': windowsize, 'residualallowed': residualallowed, 'estimator': estimator, 'rollingwindow': rollingwindow if estimator != 'segments' else None}
+        store.add([(datadir, vialnums[z], sampledata[z], settings) + results[z][0][2] for z in range(n)])
+
+    if instrument:
+        vialstats = [stats for result, stats in results]
+        for index, stats in plotstats:
+            vialstats[index]['stages'].update(stats['stages'])
+            vialstats[index]['peak RSS (MB)'] = max(vialstats[index]['peak RSS (MB)'] or 0, stats['peak RSS (MB)'] or 0) or None
+        with open(statsfilename, 'w') as statsfile:
+            for z in range(n):
+                statsfile.write(json.dumps(dict({'vial': vialnums[z], 'sample': vials[vialnums[z]]}, **vialstats[z])) + '\n')
+            statsfile.write(json.dumps({'batch': {'vials': n, 'workers': workers, 'seconds': time.perf_counter() - started, 'CSV write seconds': csvseconds, 'peak RSS (MB)': peakrss()}}) + '\n')
+
+    return(sampledata)
+
+
+#Runs the window search on one vial for every combination of window size, residuals allowed and minimum pump events
+#The growth rates and their running sums (prefixsums()) are made once, the centered window residuals once per window size, and the window once per window size and residuals allowed, with the minimum pump events only deciding which rows fail
+#Takes in the directory with the vial's files, the vial number, the sample name and a list of values for each parameter (window sizes must be odd)
+#Returns one row per combination: vial number, sample name, the three parameters, and the trimmed median, average, standard deviation and number of cycles (NaN if the vial failed with those parameters)
+def sweepvial(datadir, vialnum, samplename, windowsizes, residualsallowed, minimumpumps):
+
+    with timed('load'):
+        vial = Vial.load(vialnum, datadir, samplename)
+    with timed('segment fits'):
+        t, y, starts, ends, times, onlypumpgrowthrate, intercepts = vial.fit()
+
+    with timed('window search'):
+        sums = prefixsums(onlypumpgrowthrate)
+        rows = []
+        for windowsize in windowsizes:
+            eithersidewindow = int((windowsize - 1) / 2)
+            base = None
+            if len(onlypumpgrowthrate) > 2 * eithersidewindow:
+                base = getwindowresiduals(times, onlypumpgrowthrate, eithersidewindow, sums)
+
+            for residualallowed in residualsallowed:
+                statistics = [np.nan, np.nan, np.nan, np.nan]
+                if base is not None:
+                    baseindex, baseresidual, basemean = base
+                    stop = expandright(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow, sums)
+                    begin = expandleft(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow, sums)
+                    statistics = summarydata(samplename, onlypumpgrowthrate, baseindex-begin, baseindex+stop)[1:5]
+
+                for minimumpumpsrequired in minimumpumps:
+                    if len(onlypumpgrowthrate) > minimumpumpsrequired:
+                        rows.append([vialnum, samplename, minimumpumpsrequired, windowsize, residualallowed] + statistics)
+                    else:
+                        rows.append([vialnum, samplename, minimumpumpsrequired, windowsize, residualallowed, np.nan, np.nan, np.nan, np.nan])
+
+    return(rows)
+
+
+#Runs sweepvial() on every vial in the vials dictionary (vial number: sample name) on a pool of worker processes
+#Saves the long-format table (one row per vial and parameter combination) as a CSV
+#Returns the rows
+def runsweep(datadir, vials, outputfilename, windowsizes, residualsallowed, minimumpumps, workers = None):
+
+    vialnums = list(vials)
+    n = len(vialnums)
+    arguments = [[datadir]*n, vialnums, [vials[z] for z in vialnums], [windowsizes]*n, [residualsallowed]*n, [minimumpumps]*n]
+
+    if workers == 1 or n <= 1:
+        results = list(map(sweepvial, *arguments))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            results = list(executor.map(sweepvial, *arguments))
+    rows = [row for result in results for row in result]
+
+    with open(outputfilename, 'w', newline = '') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["vial", "sample name", "Minimum pump events required", "Initial window size", "Residuals allowed", "trimmed median", "trimmed average", "trimmed standard deviaiton", "# of cycles included"])
+        writer.writerows(rows)
+
+    return(rows)
+
+
+#Reads a list of parameter values given on the command line, either separated by commas (5,7,11) or as first:last:step with last included (5:21:2)
+#Returns a function that does this for the given type, for argparse
+def parsevalues(type_):
+
+    def parse(text):
+        if ':' in text:
+            first, last, step = [type_(value) for value in text.split(':')]
+            return([type_(value) for value in np.arange(first, last + step / 2, step)])
+        return([type_(value) for value in text.split(',')])
+
+    return(parse)
+
+
+#Finds every experiment directory under root, i.e. every directory with at least one vialN_OD.txt that has a vialN_pump_log.txt next to it
+#Hidden directories (like the caches) are skipped
+#The sample names come from samples.json in the experiment directory ({"vial number": "sample name"}) if there is one, otherwise the vials are called vialN
+#Returns a list of (directory, vials dictionary), sorted by directory
+def discoverexperiments(root):
+
+    experiments = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories[:] = sorted(subdirectory for subdirectory in subdirectories if not subdirectory.startswith('.'))
+        names = set(filenames)
+        vialnums = sorted(int(match.group(1)) for match in (re.fullmatch(r'vial(\d+)_OD\.txt', filename) for filename in filenames) if match is not None and 'vial'+match.group(1)+'_pump_log.txt' in names)
+        if not vialnums:
+            continue
+
+        samplenames = {}
+        if 'samples.json' in names:
+            with open(os.path.join(directory, 'samples.json')) as samplesfile:
+                samplenames = {int(z): str(samplename) for z, samplename in json.load(samplesfile).items()}
+        experiments.append((directory, {z: samplenames.get(z, 'vial'+str(z)) for z in vialnums}))
+
+    return(experiments)
+
+
+#Work queue of vial jobs kept in a directory, so any number of processes on any number of machines sharing the directory can work through it
+#Every job is a JSON file that moves pending/ -> running/ -> done/ (or failed/), each move being a rename so only one worker can claim a job
+#A finished job leaves its checkpoint in done/, with the output CSV row and growth rates, so an interrupted reprocess picks up where it stopped
+#Jobs keep their experiment directory relative to the root that was planned, so every machine can mount the archive wherever it likes and pass its own root
+#A job's id is a hash of its (relative) directory, vial, sample name, settings and the code version, so changing any of them makes new jobs while finished ones are kept
+#A worker touches its running job's file every so often while working on it (heartbeat()), and a running job whose file hasn't been touched for lease seconds (its worker died) is put back in pending/
+class WorkQueue:
+
+    states = ['pending', 'running', 'done', 'failed']
+
+    def __init__(self, root, lease = 3600):
+        self.root = root
+        self.lease = lease
+        for state in self.states:
+            os.makedirs(os.path.join(root, state), exist_ok = True)
+
+    def path(self, state, jobid):
+        return(os.path.join(self.root, state, jobid+'.json'))
+
+    def jobs(self, state):
+        return(sorted(filename[:-5] for filename in os.listdir(os.path.join(self.root, state)) if filename.endswith('.json')))
+
+    #Writes a JSON file so that it never shows up half written
+    def write(self, path, job):
+
+        temporary = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temporary, 'w') as jobfile:
+            json.dump(job, jobfile)
+        os.replace(temporary, path)
+
+    def read(self, path):
+
+        with open(path) as jobfile:
+            return(json.load(jobfile))
+
+    #Adds a job for every vial of every experiment under root, apart from the ones that are already queued or finished (failed jobs are queued again)
+    #Takes in the settings passed to analyzevial() (minimumpumpsrequired, windowsize, residualallowed, estimator, rollingwindow)
+    #Also saves the list of every job in manifest.json
+    #Returns the number of jobs added
+    def plan(self, root, settings):
+
+        version = codeversion()
+        known = set(job for state in ['pending', 'running', 'done'] for job in self.jobs(state))
+        manifest = []
+        added = 0
+        for datadir, vials in discoverexperiments(root):
+            datadir = os.path.relpath(datadir, root).replace(os.sep, '/')
+            for vialnum, samplename in vials.items():
+                job = {'datadir': datadir, 'vial': vialnum, 'sample': samplename, 'settings': settings, 'codeversion': version}
+                job['id'] = hashlib.sha256(json.dumps(job, sort_keys = True).encode()).hexdigest()[:24]
+                manifest.append(job)
+                if job['id'] not in known:
+                    self.write(self.path('pending', job['id']), job)
+                    if os.path.exists(self.path('failed', job['id'])):
+                        os.remove(self.path('failed', job['id']))
+                    added = added + 1
+
+        self.write(os.path.join(self.root, 'manifest.json'), manifest)
+
+        return(added)
+
+    #Puts the running jobs whose lease has run out back in pending/
+    def reclaim(self):
+
+        for jobid in self.jobs('running'):
+            try:
+                if time.time() - os.path.getmtime(self.path('running', jobid)) > self.lease:
+                    os.rename(self.path('running', jobid), self.path('pending', jobid))
+            except FileNotFoundError:
+                pass
+
+    #Claims the next pending job
+    #Returns the job, or None if there is nothing left to claim
+    def claim(self):
+
+        for jobid in self.jobs('pending'):
+            try:
+                os.rename(self.path('pending', jobid), self.path('running', jobid))
+            except FileNotFoundError:
+                continue
+            os.utime(self.path('running', jobid))
+            return(self.read(self.path('running', jobid)))
+
+        return(None)
+
+    #Keeps touching a running job's file (every tenth of the lease) until the returned event is set, so a job that takes longer than the lease isn't claimed again
+    def heartbeat(self, job):
+
+        import threading
+
+        stopped = threading.Event()
+
+        def beat():
+            while not stopped.wait(self.lease / 10):
+                try:
+                    os.utime(self.path('running', job['id']))
+                except FileNotFoundError:
+                    return
+
+        threading.Thread(target = beat, daemon = True).start()
+
+        return(stopped)
+
+    #Saves the checkpoint of a finished (or failed) job and takes it out of running/
+    def finish(self, job, state):
+
+        self.write(self.path(state, job['id']), job)
+        try:
+            os.remove(self.path('running', job['id']))
+        except FileNotFoundError:
+            pass
+
+    def status(self):
+        return({state: len(self.jobs(state)) for state in self.states})
+
+    #Checkpoints of every finished job that is in the current manifest
+    def results(self):
+
+        manifest = self.read(os.path.join(self.root, 'manifest.json'))
+        done = set(self.jobs('done'))
+
+        return([self.read(self.path('done', job['id'])) for job in manifest if job['id'] in done])
+
+
+#Works through a WorkQueue until there are no jobs left to claim
+#Takes in the queue directory, the root the experiment directories of the jobs are relative to (where this machine sees the archive), the lease in seconds, whether to draw the figures (next to each vial's files) and where to keep an ArtifactCache (None for no cache)
+#Can be run at the same time on every machine that can see the queue directory
+#Returns the number of jobs this worker finished
+def workqueue(queuedir, root = '.', lease = 3600, plots = True, cachedir = None):
+
+    import platform
+
+    queue = WorkQueue(queuedir, lease)
+    cache = ArtifactCache(cachedir) if cachedir is not None else None
+    worker = platform.node() + ':' + str(os.getpid())
+    finished = 0
+
+    queue.reclaim()
+    job = queue.claim()
+    while job is not None:
+        started = time.perf_counter()
+        settings = job['settings']
+        heartbeat = queue.heartbeat(job)
+        try:
+            data, plotjob, (growthtimes, growthrates) = analyzevial(os.path.join(root, job['datadir']), job['vial'], job['sample'], settings['minimumpumpsrequired'], settings['windowsize'], settings['residualallowed'], plots, cache, settings['estimator'], settings['rollingwindow'])
+            if plotjob is not None:
+                savevialfigure(*plotjob)
+        except Exception as error:
+            heartbeat.set()
+            job.update({'error': repr(error), 'worker': worker})
+            queue.finish(job, 'failed')
+        else:
+            heartbeat.set()
+            job.update({'row': [x.item() if isinstance(x, np.generic) else x for x in data], 'times': [float(x) for x in growthtimes], 'growthrates': [float(x) for x in growthrates],
+                'worker': worker, 'seconds': time.perf_counter() - started, 'finished': datetime.now().isoformat(timespec = 'seconds')})
+            queue.finish(job, 'done')
+            finished = finished + 1
+        job = queue.claim()
+
+    if cache is not None:
+        cache.evict()
+
+    return(finished)
+
+
+#Saves the finished jobs of a WorkQueue as one output CSV per experiment (outputname inside each experiment directory under root) and/or adds them to a ResultsStore
+#Jobs that haven't finished are left out
+#Returns the number of jobs collected
+def collectqueue(queuedir, root = '.', outputname = None, store = None):
+
+    runs = WorkQueue(queuedir).results()
+
+    if outputname is not None:
+        experiments = {}
+        for run in runs:
+            experiments.setdefault(run['datadir'], []).append(run)
+        for datadir, experimentruns in experiments.items():
+            writesampledata(os.path.join(root, datadir, outputname), [run['row'] for run in sorted(experimentruns, key = lambda run: run['vial'])])
+
+    if store is not None:
+        store.add([(os.path.join(root, run['datadir']), run['vial'], run['row'], run['settings'], np.array(run['times']), np.array(run['growthrates'])) for run in runs])
+
+    return(len(runs))
+
+
+#Works through a WorkQueue on a pool of local worker processes
+#Returns the number of jobs finished
+def runqueue(queuedir, root = '.', workers = None, lease = 3600, plots = True, cachedir = None):
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return(workqueue(queuedir, root, lease, plots, cachedir))
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        return(sum(executor.map(workqueue, [queuedir]*workers, [root]*workers, [lease]*workers, [plots]*workers, [cachedir]*workers)))
+
+
+#Reads whatever has been added to a turbidostat file since the last time it was read
+#Only the new bytes are read, and a line that hasn't been finished yet is kept until the rest of it shows up
+#If the file gets shorter (the turbidostat started a new experiment) it starts over from the beginning
+class LogTail:
+
+    def __init__(self, path):
+        self.path = path
+        self.restart()
+
+    def restart(self):
+        self.offset = 0
+        self.partial = b''
+        self.header = None
+
+    #Returns the new rows as an N x 2 array and whether the file started over
+    def read(self):
+
+        restarted = False
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return(np.empty((0, 2)), restarted)
+        if size < self.offset:
+            self.restart()
+            restarted = True
+        if size == self.offset:
+            return(np.empty((0, 2)), restarted)
+
+        with open(self.path, 'rb') as datafile:
+            datafile.seek(self.offset)
+            chunk = datafile.read(size - self.offset)
+        self.offset = self.offset + len(chunk)
+
+        lines = (self.partial + chunk).split(b'\n')
+        self.partial = lines.pop()
+        if self.header is None and len(lines) > 0:
+            self.header = parseheader(lines.pop(0).decode())
+
+        lines = [line.decode() for line in lines if line.strip()]
+        if len(lines) == 0:
+            return(np.empty((0, 2)), restarted)
+
+        return(np.loadtxt(lines, delimiter = ',', ndmin = 2, dtype = float).reshape(-1, 2), restarted)
+
+
+#Keeps the window search up to date as growth rates are added one at a time
+#Gives the same baseindex, begin and stop as findwindow() on all of the growth rates so far, without starting over each time
+#The running sums are shifted by the first growth rate instead of the mean, since the mean isn't known yet
+class WindowTracker:
+
+    def __init__(self, minimumpumpsrequired = 10, windowsize = 11, residualallowed = 5):
+        self.minimumpumpsrequired = minimumpumpsrequired
+        self.eithersidewindow = int((windowsize - 1) / 2)
+        self.residualallowed = residualallowed
+        self.times = []
+        self.onlypumpgrowthrate = []
+        self.sums = None
+        self.baseindex = None
+
+    def append(self, pumptime, growthrate):
+
+        if self.sums is None:
+            self.sums = (growthrate, [0.0], [0.0])
+        shifted = growthrate - self.sums[0]
+        self.sums[1].append(self.sums[1][-1] + shifted)
+        self.sums[2].append(self.sums[2][-1] + shifted * shifted)
+        self.times.append(pumptime)
+        self.onlypumpgrowthrate.append(growthrate)
+
+        #The only new centered window is the one that ends at the new growth rate. Ties keep the earlier window, same as getwindowresiduals().
+        windowsize = 2 * self.eithersidewindow + 1
+        hi = len(self.onlypumpgrowthrate)
+        lo = hi - windowsize
+        if lo >= 0:
+            mean_ = self.sums[0] + (self.sums[1][hi] - self.sums[1][lo]) / windowsize
+            residual = windowdeviation(self.sums, lo, hi, mean_)
+            tolerance = 2 * windowtolerance(self.sums)
+            if self.baseindex is None or residual < self.bestresidual - tolerance or (residual <= self.bestresidual + tolerance
+                    and loopwindow(self.onlypumpgrowthrate, lo, hi)[1] < loopwindow(self.onlypumpgrowthrate, self.baseindex - self.eithersidewindow, self.baseindex + self.eithersidewindow + 1)[1]):
+                self.bestresidual = residual
+                self.baseindex = lo + self.eithersidewindow
+                self.baseresidual = residual / ((self.eithersidewindow+1)*2)
+                self.basemean = mean_
+                self.loopbase = None
+                self.begin = self.expandleft()
+                self.stop = None
+                self.nextright = self.eithersidewindow + 1
+
+    #Same as expandleft(). Only depends on growth rates up to the end of the base window, so it is worked out once per baseindex.
+    def expandleft(self):
+
+        e = self.eithersidewindow
+        for x in range(e+1, self.baseindex):
+            deviation = windowdeviation(self.sums, self.baseindex - x, self.baseindex + e, self.basemean) / (x + e)
+            if self.exceeds(deviation, self.baseindex - x, self.baseindex + e):
+                return(x - 1)
+
+        return(self.baseindex - 2)
+
+    #Same as expandright(), but picks up checking where it left off last time
+    def expandright(self):
+
+        e = self.eithersidewindow
+        while self.stop is None and self.nextright < len(self.onlypumpgrowthrate) - self.baseindex - e:
+            x = self.nextright
+            deviation = windowdeviation(self.sums, self.baseindex - e, self.baseindex + x, self.basemean) / (x + e)
+            if self.exceeds(deviation, self.baseindex - e, self.baseindex + x):
+                self.stop = x - 2
+            self.nextright = x + 1
+
+        if self.stop is not None:
+            return(self.stop)
+        return(len(self.onlypumpgrowthrate) - self.baseindex - 2)
+
+    #Whether the growth rates in [lo:hi] go over the threshold, settling ties the same way as expandright() and expandleft()
+    def exceeds(self, deviation, lo, hi):
+
+        threshold = self.baseresidual * self.residualallowed
+        if abs(deviation - threshold) <= windowtolerance(self.sums) * (1 + self.residualallowed):
+            if self.loopbase is None:
+                self.loopbase = loopbase(self.onlypumpgrowthrate, self.baseindex, self.eithersidewindow)
+            return(loopexceeds(self.onlypumpgrowthrate, lo, hi, self.loopbase, self.residualallowed))
+
+        return(deviation > threshold)
+
+    #Returns baseindex, begin and stop, or None if there are not enough pump events yet
+    def window(self):
+
+        if len(self.onlypumpgrowthrate) <= self.minimumpumpsrequired or self.baseindex is None:
+            return(None)
+
+        return(self.baseindex, self.begin, self.expandright())
+
+
+#Follows one vial while the experiment is running
+#Each poll reads only what was added to the OD file and pump log, closes a section whenever a point at or after the next pump time shows up, and fits only that section
+#Sections end the same way as in segmentbounds(), except that the section after the last pump stays open until the next pump
+class VialFollower:
+
+    def __init__(self, datadir, vialnum, samplename, minimumpumpsrequired = 10, windowsize = 11, residualallowed = 5):
+        self.vialnum = vialnum
+        self.samplename = samplename
+        self.settings = (minimumpumpsrequired, windowsize, residualallowed)
+        self.odtail = LogTail(os.path.join(datadir, 'vial'+str(vialnum)+'_OD.txt'))
+        self.pumptail = LogTail(os.path.join(datadir, 'vial'+str(vialnum)+'_pump_log.txt'))
+        self.restart()
+
+    def restart(self):
+        self.odtail.restart()
+        self.pumptail.restart()
+        self.sentinelskipped = False
+        self.pendingpumps = deque()
+        self.t = np.empty(0)
+        self.y = np.empty(0)
+        self.tracker = WindowTracker(*self.settings)
+
+    #Returns True if any sections were closed
+    def poll(self):
+
+        #The pump log is read first so that a pump isn't missed when its OD point is already there
+        pumplog, restarted = self.pumptail.read()
+        if restarted:
+            self.restart()
+            pumplog, restarted = self.pumptail.read()
+        if not self.sentinelskipped and len(pumplog) > 0:
+            pumplog = pumplog[1:]
+            self.sentinelskipped = True
+        self.pendingpumps.extend(pumplog[:, 0].tolist())
+
+        vialOD, restarted = self.odtail.read()
+        if restarted:
+            self.pumptail.restart()
+            self.restart()
+            return(self.poll())
+        t, y, lastvalid = validlnod(vialOD)
+        if len(t) > 0:
+            self.t = np.concatenate((self.t, t))
+            self.y = np.concatenate((self.y, y))
+
+        closed = False
+        while len(self.pendingpumps) > 0:
+            end = int(np.searchsorted(self.t, self.pendingpumps[0], side = 'left'))
+            if end >= len(self.t):
+                break
+            #A pump with no usable point since the last one leaves an empty section, which is left out like in segmentfits()
+            if end > 0:
+                slopes, intercepts = segmentslopes(self.t, self.y, np.array([0]), np.array([end]))
+                self.tracker.append(self.t[end], slopes[0])
+            self.t = self.t[end+1:]
+            self.y = self.y[end+1:]
+            self.pendingpumps.popleft()
+            closed = True
+
+        return(closed)
+
+    #Returns the row for the output CSV using the sections closed so far
+    def summary(self):
+
+        window = self.tracker.window()
+        if window is None:
+            return([self.samplename, np.nan, np.nan, np.nan, np.nan])
+
+        baseindex, begin, stop = window
+        return(summarydata(self.samplename, np.asarray(self.tracker.onlypumpgrowthrate), baseindex-begin, baseindex+stop, *self.settings))
+
+
+#Follows every vial in the vials dictionary (vial number: sample name) while the experiment is running
+#Every interval seconds, polls each vial, prints the rows of the vials that changed and saves all of the rows as the output CSV
+#Runs until interrupted, or for the given number of polls
+def follow(datadir, vials, outputfilename, minimumpumpsrequired = 10, windowsize = 11, residualallowed = 5, interval = 60, polls = None):
+
+    followers = [VialFollower(datadir, z, vials[z], minimumpumpsrequired, windowsize, residualallowed) for z in vials]
+    sampledata = [follower.summary() for follower in followers]
+    writer = csv.writer(sys.stdout)
+
+    poll = 0
+    try:
+        while polls is None or poll < polls:
+            if poll > 0:
+                time.sleep(interval)
+            changed = False
+            for z in range(len(followers)):
+                if followers[z].poll():
+                    sampledata[z] = followers[z].summary()
+                    writer.writerow(['vial'+str(followers[z].vialnum)] + sampledata[z])
+                    changed = True
+            if changed or poll == 0:
+                sys.stdout.flush()
+                writesampledata(outputfilename, sampledata)
+            poll = poll + 1
+    except KeyboardInterrupt:
+        pass
+
+    return(sampledata)
+
+
+#Interactive session for going back over the vials of an experiment once it has been analyzed, without loading or fitting anything twice
+#Every vial is loaded and fitted once when the session starts, and its figure is kept in memory
+#The window lines on the growth rate graph are drawn on top of a saved image of the rest of the figure, so changing a window only redraws those two lines
+#Every change remakes only that vial's row and saves the output CSV from the rows kept in memory
+class Session(cmd.Cmd):
+
+    intro = 'Type help to see the commands and quit to stop.'
+    prompt = '(turbidostat) '
+
+    def __init__(self, datadir, vials, outputfilename, minimumpumpsrequired = 10, windowsize = 11, residualallowed = 5, plots = True):
+
+        super().__init__()
+        self.datadir = datadir
+        self.outputfilename = outputfilename
+        self.settings = (minimumpumpsrequired, windowsize, residualallowed)
+        self.plots = plots
+        self.experiment = Experiment.load(datadir, vials)
+        self.fits = {}
+        self.rows = {}
+        self.figures = {}
+
+        for vial in self.experiment:
+            self.fits[vial.vialnum] = vial.fit()
+            self.analyze(vial.vialnum, *self.settings)
+        self.save()
+
+    #Finds the window of one vial with the given parameters, like main() does
+    def analyze(self, vialnum, minimumpumpsrequired, windowsize, residualallowed):
+
+        times, onlypumpgrowthrate = self.fits[vialnum][4:6]
+        window = findwindow(times, onlypumpgrowthrate, minimumpumpsrequired, windowsize, residualallowed)
+        if window is not None:
+            baseindex, begin, stop = window
+            windowlines = (baseindex-begin, baseindex+stop)
+            self.rows[vialnum] = summarydata(self.experiment[vialnum].samplename, onlypumpgrowthrate, baseindex-begin, baseindex+stop, minimumpumpsrequired, windowsize, residualallowed)
+        else:
+            windowlines = None
+            self.rows[vialnum] = [self.experiment[vialnum].samplename, np.nan, np.nan, np.nan, np.nan]
+            print('Vial'+str(vialnum)+' failed analysis because it had too few data points.')
+        self.draw(vialnum, windowlines)
+
+    #Uses the window the user picked for one vial, like fittingbyself() in main()
+    def refit(self, vialnum, start, stop):
+
+        times, onlypumpgrowthrate = self.fits[vialnum][4:6]
+        if len(times) == 0:
+            raise ValueError('vial'+str(vialnum)+' has no growth rates to refit')
+        startindex, stopindex = fittingbyself(start, stop, times)
+        self.rows[vialnum] = summarydata(self.experiment[vialnum].samplename, onlypumpgrowthrate, startindex, stopindex, "Defined by user")
+        self.draw(vialnum, (startindex, stopindex))
+
+    #Saves the figure of one vial with the window lines at windowlines (indeces in times, or None for no lines)
+    #The first time, the whole figure is drawn without the lines and kept as the background, after that only the lines are drawn over it
+    def draw(self, vialnum, windowlines):
+
+        if not self.plots:
+            return
+
+        import matplotlib.image
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        t, y, starts, ends, times, onlypumpgrowthrate, intercepts = self.fits[vialnum]
+        samplename = self.experiment[vialnum].samplename
+        if vialnum not in self.figures:
+            fig = Figure(figsize = (10,10))
+            canvas = FigureCanvasAgg(fig)
+            ax1, ax2 = fig.subplots(2, sharex = True)
+            drawOD(ax1, vialplotdata(t, y, starts, ends, onlypumpgrowthrate, intercepts))
+            drawgrowthrates(ax2, times, onlypumpgrowthrate, None)
+            lines = [ax2.axvline(x = times[0] if len(times) > 0 else 0, animated = True) for x in range(2)]
+            finishfigure(fig, ax1, ax2, samplename)
+            fig.set_facecolor('white')
+            canvas.draw()
+            self.figures[vialnum] = (canvas, ax2, lines, canvas.copy_from_bbox(fig.bbox))
+
+        canvas, ax2, lines, background = self.figures[vialnum]
+        canvas.restore_region(background)
+        if windowlines is not None and len(times) > 0:
+            for line, index in zip(lines, windowlines):
+                line.set_xdata([times[min(index, len(times) - 1)]]*2)
+                ax2.draw_artist(line)
+        matplotlib.image.imsave(os.path.join(self.datadir, 'vial'+str(vialnum)+'_'+slugify(samplename)+'.png'), np.asarray(canvas.buffer_rgba()))
+
+    def save(self):
+        writesampledata(self.outputfilename, [self.rows[z] for z in self.experiment.vials])
+
+    #Reads the vial number at the start of a command
+    def vialnumber(self, text):
+
+        vialnum = int(text)
+        if vialnum not in self.experiment.vials:
+            raise ValueError('vial'+str(vialnum)+' is not in this session')
+
+        return(vialnum)
+
+    def show(self, vialnum, started):
+
+        row = self.rows[vialnum]
+        print('vial'+str(vialnum), *row[:5], *row[9:], sep = '\t')
+        print('({:.1f} ms)'.format((time.perf_counter() - started) * 1000))
+
+    def do_list(self, arg):
+        'list: show the row of every vial (sample name, trimmed median, average, standard deviation, # of cycles, settings)'
+        for vialnum in self.experiment.vials:
+            row = self.rows[vialnum]
+            print('vial'+str(vialnum), *row[:5], *row[9:], sep = '\t')
+
+    def do_refit(self, arg):
+        'refit N START STOP: use the growth rates of vial N from START to STOP hours'
+        started = time.perf_counter()
+        try:
+            vialnum, start, stop = arg.split()
+            vialnum = self.vialnumber(vialnum)
+            self.refit(vialnum, float(start), float(stop))
+        except ValueError as error:
+            print('refit N START STOP ('+str(error)+')')
+            return
+        self.save()
+        self.show(vialnum, started)
+
+    def do_rerun(self, arg):
+        'rerun N [MINIMUMPUMPS WINDOWSIZE RESIDUALALLOWED]: find the window of vial N again, with the session\'s parameters or the ones given'
+        started = time.perf_counter()
+        try:
+            values = arg.split()
+            vialnum = self.vialnumber(values[0])
+            settings = self.settings
+            if len(values) > 1:
+                minimumpumpsrequired, windowsize, residualallowed = values[1:]
+                settings = (int(minimumpumpsrequired), int(windowsize), parsenumber(residualallowed))
+            if settings[1] % 2 != 1:
+                raise ValueError('the window size must be odd')
+            self.analyze(vialnum, *settings)
+        except (ValueError, IndexError) as error:
+            print('rerun N [MINIMUMPUMPS WINDOWSIZE RESIDUALALLOWED] ('+str(error)+')')
+            return
+        self.save()
+        self.show(vialnum, started)
+
+    def do_quit(self, arg):
+        'quit: stop the session (the output CSV is already saved)'
+        return(True)
+
+    def do_EOF(self, arg):
+        print()
+        return(True)
+
+    def emptyline(self):
+        pass
+
+
+#Makes realistic synthetic files (vialN_OD.txt and vialN_pump_log.txt, same format as the turbidostat's) for one vial, to benchmark the script and check that known growth rates are recovered
+#growthrate is the growth rate (h^-1) once the culture has adapted. Before that it grows at lagrate, switching over smoothly around lagtime (h) over about transition hours
+#The culture starts at startOD and is diluted back down to lowerOD at every reading above upperOD, with the pump time written to the pump log
+#noise is the standard deviation of the multiplicative noise on each OD reading and nanfraction is the fraction of readings that come out as nan
+#Returns the growth rate the culture ends up at
+def generatevial(datadir, vialnum, growthrate = 0.25, hours = 70, sampleinterval = 0.0056, noise = 0.01, lowerOD = 0.15, upperOD = 0.17, startOD = 0.02, lagrate = 0.05, lagtime = 10, transition = 2, nanfraction = 0.0001, experiment = 'synthetic', start = None, seed = None):
+
+    rng = np.random.default_rng(seed)
+    if start is None:
+        start = datetime(2023, 7, 28, 15, 42, 16)
+
+    #ln(OD) without any dilutions, from the growth rate at every reading
+    t = np.arange(0.0015, hours, sampleinterval)
+    growthrates = lagrate + (growthrate - lagrate) * 0.5 * (1 + np.tanh(2 * (t - lagtime) / transition))
+    undiluted = ln(startOD) + np.concatenate(([0.0], np.cumsum(0.5 * (growthrates[1:] + growthrates[:-1]) * np.diff(t))))
+
+    #Every reading above upperOD is followed by a pump that brings the culture back to lowerOD before the next reading
+    dilution = np.zeros(len(t))
+    pumpindeces = []
+    offset = 0.0
+    index = int(np.searchsorted(undiluted, ln(upperOD), side = 'left'))
+    while index < len(t) - 1:
+        pumpindeces.append(index)
+        dilution[index+1] = undiluted[index] - ln(lowerOD) - offset
+        offset = undiluted[index] - ln(lowerOD)
+        index = max(int(np.searchsorted(undiluted, ln(upperOD) + offset, side = 'left')), index + 1)
+
+    OD = np.exp(undiluted - np.cumsum(dilution)) * (1 + noise * rng.standard_normal(len(t)))
+    OD[rng.random(len(t)) < nanfraction] = np.nan
+    pumptimes = t[pumpindeces] + sampleinterval / 2
+
+    header = 'Experiment: '+experiment+' vial '+str(vialnum)+', '+start.strftime('%a %b %d %H:%M:%S %Y')
+    np.savetxt(os.path.join(datadir, 'vial'+str(vialnum)+'_OD.txt'), np.column_stack((t, OD)), fmt = ['%.4f', '%.17g'], delimiter = ',', header = header, comments = '')
+    pumplog = np.vstack(([[0, 0]], np.column_stack((pumptimes, rng.uniform(1.8, 4, len(pumptimes)).round(2)))))
+    np.savetxt(os.path.join(datadir, 'vial'+str(vialnum)+'_pump_log.txt'), pumplog, fmt = ['%.4f', '%.2f'], delimiter = ',', header = header, comments = '')
+
+    return(growthrate)
+
+
+#Makes synthetic files for a whole experiment with generatevial(), with growth rates spread evenly between the lowest and highest growth rate
+#Also saves the growth rates as syntheticgrowthrates.json ({"vial number": growth rate}) in datadir
+#Any other settings are passed on to generatevial()
+#Returns a dictionary with the vial numbers as keys and growth rates as values
+def generateexperiment(datadir, vials = 16, lowestgrowthrate = 0.15, highestgrowthrate = 0.35, seed = 0, **settings):
+
+    os.makedirs(datadir, exist_ok = True)
+    growthrates = {}
+    for z in range(vials):
+        growthrate = lowestgrowthrate + (highestgrowthrate - lowestgrowthrate) * z / max(vials - 1, 1)
+        growthrates[z] = generatevial(datadir, z, growthrate, seed = seed + z, **settings)
+
+    with open(os.path.join(datadir, 'syntheticgrowthrates.json'), 'w') as truthfile:
+        json.dump(growthrates, truthfile)
+
+    return(growthrates)
+
+
+#Adds the settings shared by the commands to a command's parser
+def addsettingsarguments(parser):
+
+    parser.add_argument('--config', help = 'JSON file with any of the settings below')
+    parser.add_argument('--data-dir', dest = 'datadir', help = 'directory with the vialN_OD.txt and vialN_pump_log.txt files (default: current directory)')
+    parser.add_argument('--vials', type = parsevialmap, help = 'vial to sample name map, e.g. 0=1270.1,1=1270.2')
+    parser.add_argument('--minimum-pumps', dest = 'minimumpumpsrequired', type = int, help = 'pump events required to calculate a growth rate (default 10)')
+    parser.add_argument('--window-size', dest = 'windowsize', type = int, help = 'size of the window used to find the flattest region, must be odd (default 11)')
+    parser.add_argument('--residual-allowed', dest = 'residualallowed', type = parsenumber, help = 'times the initial residuals allowed when expanding the window (default 5)')
+    parser.add_argument('--output', help = 'output CSV file')
+
+
+#Combines the defaults, the config file and the command line, with the command line winning
+#Returns the settings dictionary
+def readsettings(parser, args, settings):
+
+    settings = dict({'datadir': '.', 'vials': None, 'minimumpumpsrequired': 10, 'windowsize': 11, 'residualallowed': 5, 'output': None}, **settings)
+    if args.config is not None:
+        with open(args.config) as configfile:
+            config = json.load(configfile)
+        unknown = set(config) - set(settings)
+        if unknown:
+            parser.error('unknown settings in '+args.config+': '+', '.join(sorted(unknown)))
+        settings.update(config)
+        if settings['vials'] is not None:
+            settings['vials'] = {int(z): str(samplename) for z, samplename in settings['vials'].items()}
+    for key in settings:
+        if getattr(args, key, None) is not None:
+            settings[key] = getattr(args, key)
+
+    if not settings['vials']:
+        parser.error('no vials given (use --vials or "vials" in the config file)')
+    if settings['output'] is None:
+        parser.error('no output file given (use --output or "output" in the config file)')
+    if settings['windowsize'] % 2 != 1:
+        parser.error('the window size must be odd')
+
+    return(settings)
+
+
+#Non-interactive entry point, used when the script is run with arguments
+#Settings can be given in a JSON config file and/or on the command line, with the command line winning
+#The config file can have "datadir", "vials" ({"vial number": "sample name"}), "minimumpumpsrequired", "windowsize", "residualallowed", "output" and the settings of the command being run (e.g. "workers")
+def cli(argv):
+
+    parser = argparse.ArgumentParser(description = 'Analyze turbidostat growth rates without prompts.')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    batchparser = subparsers.add_parser('batch', help = 'analyze a set of vials in parallel and save the output CSV')
+    addsettingsarguments(batchparser)
+    batchparser.add_argument('--workers', type = int, help = 'number of worker processes (default: one per CPU)')
+    batchparser.add_argument('--no-plots', dest = 'plots', action = 'store_false', default = None, help = "don't draw the figures")
+    batchparser.add_argument('--stats', action = 'store_true', default = None, help = 'save stage timings and counters for each vial as JSON lines next to the output CSV (OUTPUT.stats.jsonl)')
+    batchparser.add_argument('--estimator', choices = ['segments', 'rolling', 'auto'], help = 'growth rates from the sections between pumps, from a rolling regression, or from a rolling regression only for vials with too few pump events (default segments)')
+    batchparser.add_argument('--rolling-window', dest = 'rollingwindow', help = 'window of the rolling regression in hours (e.g. 2h) or points (e.g. 25) (default 1h)')
+    batchparser.add_argument('--bootstrap', type = int, help = 'number of bootstrap resamples for confidence intervals on the trimmed growth rate (default 0, off)')
+    batchparser.add_argument('--bootstrap-residuals', dest = 'bootstrapresiduals', action = 'store_true', default = None, help = 'resample the ln(OD) residuals within each section and redo the window search on every resample, which also gives intervals on where the window starts and ends')
+    batchparser.add_argument('--confidence', type = float, help = 'confidence level of the intervals (default 0.95)')
+    batchparser.add_argument('--bootstrap-chunk', dest = 'bootstrapchunk', type = int, help = 'largest number of values in one bootstrap array, to bound memory (default 4194304)')
+    batchparser.add_argument('--cache-dir', dest = 'cachedir', help = 'where to keep the results of each stage so unchanged vials are not redone (default: DATA_DIR/.turbidostatcache)')
+    batchparser.add_argument('--cache-size', dest = 'cachesize', type = float, help = 'size limit of the cache in MB, least recently used results are deleted first (default 1024)')
+    batchparser.add_argument('--no-cache', dest = 'usecache', action = 'store_false', default = None, help = "don't use the cache")
+    batchparser.add_argument('--rebuild', action = 'store_true', default = None, help = 'redo every stage, ignoring (but updating) the cache')
+    batchparser.add_argument('--store', help = 'SQLite results store to add every vial\'s row, growth rates and parameters to (see the results command)')
+    batchparser.add_argument('--profile-vial', dest = 'profilevial', type = int, help = 'save a cProfile dump of this vial next to the output CSV (OUTPUT.vialN.prof)')
+
+    followparser = subparsers.add_parser('follow', help = 'keep updating the growth rates while an experiment is running')
+    addsettingsarguments(followparser)
+    followparser.add_argument('--interval', type = float, help = 'seconds between polls (default 60)')
+    followparser.add_argument('--polls', type = int, help = 'stop after this many polls (default: run until interrupted)')
+
+    sweepparser = subparsers.add_parser('sweep', help = 'evaluate many combinations of the analysis parameters on every vial and save a long-format table')
+    sweepparser.add_argument('--config', help = 'JSON file with any of the settings below')
+    sweepparser.add_argument('--data-dir', dest = 'datadir', help = 'directory with the vialN_OD.txt and vialN_pump_log.txt files (default: current directory)')
+    sweepparser.add_argument('--vials', type = parsevialmap, help = 'vial to sample name map, e.g. 0=1270.1,1=1270.2')
+    sweepparser.add_argument('--window-sizes', dest = 'windowsizes', type = parsevalues(int), help = 'odd window sizes, e.g. 5,7,11 or 5:21:2 (default 11)')
+    sweepparser.add_argument('--residuals-allowed', dest = 'residualsallowed', type = parsevalues(float), help = 'residuals allowed, e.g. 2,5,10 or 1:10:0.5 (default 5)')
+    sweepparser.add_argument('--minimum-pumps', dest = 'minimumpumps', type = parsevalues(int), help = 'minimum pump events required, e.g. 5,10 (default 10)')
+    sweepparser.add_argument('--output', help = 'output CSV file')
+    sweepparser.add_argument('--workers', type = int, help = 'number of worker processes (default: one per CPU)')
+
+    resultsparser = subparsers.add_parser('results', help = 'search the results store and print or export the runs')
+    resultsparser.add_argument('--store', required = True, help = 'SQLite results store made by batch --store')
+    resultsparser.add_argument('--sample', help = 'only runs of this sample name')
+    resultsparser.add_argument('--experiment', help = 'only runs from this experiment (as named in the OD file header)')
+    resultsparser.add_argument('--vial', type = int, help = 'only runs of this vial')
+    resultsparser.add_argument('--since', help = 'only runs that started on or after this date, e.g. 2023-07-28')
+    resultsparser.add_argument('--until', help = 'only runs that started before this date')
+    resultsparser.add_argument('--days', type = float, help = 'only runs that started in the last this many days')
+    resultsparser.add_argument('--output', help = 'save the runs as a CSV instead of printing them')
+
+    sessionparser = subparsers.add_parser('session', help = 'load the vials once and refit or rerun single vials interactively, saving only what changed')
+    addsettingsarguments(sessionparser)
+    sessionparser.add_argument('--no-plots', dest = 'plots', action = 'store_false', default = None, help = "don't draw the figures")
+
+    scheduleparser = subparsers.add_parser('schedule', help = 'reprocess every experiment under a directory through a resumable work queue')
+    scheduleparser.add_argument('action', choices = ['plan', 'work', 'run', 'collect', 'status'], help = 'plan: queue a job for every vial not done yet, work: work through the queue (can run on several machines at once), run: plan, work on a local pool and collect, collect: save the finished jobs, status: count the jobs')
+    scheduleparser.add_argument('--root', default = '.', help = 'directory to search for experiment directories, and where this machine sees them when working or collecting (default: current directory)')
+    scheduleparser.add_argument('--queue', help = 'work queue directory, shared between machines (default: ROOT/.turbidostatqueue)')
+    scheduleparser.add_argument('--minimum-pumps', dest = 'minimumpumpsrequired', type = int, default = 10, help = 'pump events required to calculate a growth rate (default 10)')
+    scheduleparser.add_argument('--window-size', dest = 'windowsize', type = int, default = 11, help = 'size of the window used to find the flattest region, must be odd (default 11)')
+    scheduleparser.add_argument('--residual-allowed', dest = 'residualallowed', type = parsenumber, default = 5, help = 'times the initial residuals allowed when expanding the window (default 5)')
+    scheduleparser.add_argument('--estimator', choices = ['segments', 'rolling', 'auto'], default = 'segments', help = 'where the growth rates come from, as for batch (default segments)')
+    scheduleparser.add_argument('--rolling-window', dest = 'rollingwindow', default = '1h', help = 'window of the rolling regression in hours or points (default 1h)')
+    scheduleparser.add_argument('--workers', type = int, help = 'number of local worker processes for run (default: one per CPU)')
+    scheduleparser.add_argument('--lease', type = float, default = 3600, help = 'seconds without a heartbeat from a running job\'s worker after which the job is assumed to be abandoned and is queued again (default 3600)')
+    scheduleparser.add_argument('--no-plots', dest = 'plots', action = 'store_false', help = "don't draw the figures")
+    scheduleparser.add_argument('--cache-dir', dest = 'cachedir', help = 'where to keep the results of each stage (default: no cache)')
+    scheduleparser.add_argument('--output', help = 'name of the output CSV to save in each experiment directory when collecting')
+    scheduleparser.add_argument('--store', help = 'SQLite results store to add the finished jobs to when collecting')
+
+    generateparser = subparsers.add_parser('generate', help = 'write synthetic vialN_OD.txt and vialN_pump_log.txt files with known growth rates')
+    generateparser.add_argument('--data-dir', dest = 'datadir', required = True, help = 'directory to write the files to')
+    generateparser.add_argument('--vials', type = int, default = 16, help = 'number of vials (default 16)')
+    generateparser.add_argument('--hours', type = float, default = 70, help = 'length of the run in hours (default 70)')
+    generateparser.add_argument('--lowest-growth-rate', dest = 'lowestgrowthrate', type = float, default = 0.15, help = 'growth rate of the first vial (default 0.15)')
+    generateparser.add_argument('--highest-growth-rate', dest = 'highestgrowthrate', type = float, default = 0.35, help = 'growth rate of the last vial (default 0.35)')
+    generateparser.add_argument('--noise', type = float, default = 0.01, help = 'standard deviation of the multiplicative OD noise (default 0.01)')
+    generateparser.add_argument('--lower-od', dest = 'lowerOD', type = float, default = 0.15, help = 'OD the culture is diluted down to (default 0.15)')
+    generateparser.add_argument('--upper-od', dest = 'upperOD', type = float, default = 0.17, help = 'OD at which the culture is diluted (default 0.17)')
+    generateparser.add_argument('--lag-time', dest = 'lagtime', type = float, default = 10, help = 'hours until the culture reaches its growth rate (default 10)')
+    generateparser.add_argument('--transition', type = float, default = 2, help = 'hours the switch to the final growth rate takes (default 2)')
+    generateparser.add_argument('--seed', type = int, default = 0, help = 'random seed (default 0)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        generateexperiment(args.datadir, args.vials, args.lowestgrowthrate, args.highestgrowthrate, args.seed, hours = args.hours, noise = args.noise, lowerOD = args.lowerOD, upperOD = args.upperOD, lagtime = args.lagtime, transition = args.transition)
+
+    if args.command == 'batch':
+        settings = readsettings(batchparser, args, {'workers': None, 'plots': True, 'stats': False, 'profilevial': None, 'usecache': True, 'cachedir': None, 'cachesize': 1024, 'rebuild': False, 'estimator': 'segments', 'rollingwindow': '1h', 'store': None, 'bootstrap': 0, 'bootstrapresiduals': False, 'confidence': 0.95, 'bootstrapchunk': 2**22})
+        statsfilename = os.path.splitext(settings['output'])[0]+'.stats.jsonl' if settings['stats'] else None
+        cache = None
+        if settings['usecache']:
+            cache = ArtifactCache(settings['cachedir'] or os.path.join(settings['datadir'], '.turbidostatcache'), settings['cachesize'] * 1024**2, settings['rebuild'])
+        store = ResultsStore(settings['store']) if settings['store'] is not None else None
+        try:
+            runbatch(settings['datadir'], settings['vials'], settings['output'], settings['minimumpumpsrequired'], settings['windowsize'], settings['residualallowed'], settings['workers'], settings['plots'], statsfilename, settings['profilevial'], cache, settings['estimator'], settings['rollingwindow'], store, settings['bootstrap'], (settings['bootstrapresiduals'], settings['confidence'], settings['bootstrapchunk']))
+        finally:
+            if store is not None:
+                store.close()
+
+    if args.command == 'session':
+        settings = readsettings(sessionparser, args, {'plots': True})
+        Session(settings['datadir'], settings['vials'], settings['output'], settings['minimumpumpsrequired'], settings['windowsize'], settings['residualallowed'], settings['plots']).cmdloop()
+
+    if args.command == 'schedule':
+        if args.windowsize % 2 != 1:
+            scheduleparser.error('the window size must be odd')
+        queuedir = args.queue or os.path.join(args.root, '.turbidostatqueue')
+        if args.action in ('plan', 'run'):
+            settings = {'minimumpumpsrequired': args.minimumpumpsrequired, 'windowsize': args.windowsize, 'residualallowed': args.residualallowed, 'estimator': args.estimator, 'rollingwindow': args.rollingwindow}
+            print(str(WorkQueue(queuedir, args.lease).plan(args.root, settings))+' jobs queued')
+        if args.action == 'work':
+            print(str(workqueue(queuedir, args.root, args.lease, args.plots, args.cachedir))+' jobs finished')
+        if args.action == 'run':
+            print(str(runqueue(queuedir, args.root, args.workers, args.lease, args.plots, args.cachedir))+' jobs finished')
+        if args.action in ('run', 'collect'):
+            store = ResultsStore(args.store) if args.store is not None else None
+            print(str(collectqueue(queuedir, args.root, args.output, store))+' jobs collected')
+            if store is not None:
+                store.close()
+        print(', '.join(str(count)+' '+state for state, count in WorkQueue(queuedir).status().items()))
+
+    if args.command == 'results':
+        store = ResultsStore(args.store)
+        since = args.since
+        if args.days is not None:
+            since = max(since or '', (datetime.now() - timedelta(days = args.days)).isoformat(timespec = 'seconds'))
+        runs = store.query(args.sample, args.experiment, args.vial, since, args.until)
+        if args.output is not None:
+            store.export(args.output, runs)
+        else:
+            for run in runs:
+                print(run['date'], run['experiment'], 'vial'+str(run['vial']), run['sample'], run['trimmedmedian'], run['cyclesincluded'], sep = '\t')
+        store.close()
+
+    if args.command == 'sweep':
+        settings = readsettings(sweepparser, args, {'windowsizes': [11], 'residualsallowed': [5], 'minimumpumps': [10], 'workers': None})
+        if any(windowsize % 2 != 1 for windowsize in settings['windowsizes']):
+            sweepparser.error('the window sizes must be odd')
+        runsweep(settings['datadir'], settings['vials'], settings['output'], settings['windowsizes'], settings['residualsallowed'], settings['minimumpumps'], settings['workers'])
+
+    if args.command == 'follow':
+        settings = readsettings(followparser, args, {'interval': 60, 'polls': None})
+        follow(settings['datadir'], settings['vials'], settings['output'], settings['minimumpumpsrequired'], settings['windowsize'], settings['residualallowed'], settings['interval'], settings['polls'])
+
 
 ###############################################################################
 ########################End of defining functions##############################
@@ -287,6 +2333,10 @@ def main():
 
     #Asks user to input if they are running consecutive or nonconsecutive vials
     selfcheck = input("Do you want to be able to check the graphs and modify settings? (yes/no): ")
+
+    #pyplot is only needed to show the figures while checking them
+    if selfcheck == 'yes':
+        import matplotlib.pyplot as plt
     
     consecutive = input("Are the vials that you would like to run consecutive? (ie, 3,4,5 or 2,3) (yes/no): ")
 
@@ -318,18 +2368,19 @@ def main():
     #Loops through each vial that was used, finding the window size, median, averages, and number of points included.
     for z in range(len(vialnums)):
 
-        #Imports vial OD data
-        vialOD = importOD(vialnums[z])
+        #Imports vial OD data and pump times
+        vial = Vial.load(vialnums[z], samplename = samplenames[z])
 
-        #Imports vial pump times
-        vialpumptimes = importpumptimes(vialnums[z])
+        #gets times of/immediately after pump events and the growth rate of the section immediately prior the pump event, and what is needed to graph the fits
+        t, y, starts, ends, times, onlypumpgrowthrate, intercepts = vial.fit()
+        plotdata = vialplotdata(t, y, starts, ends, onlypumpgrowthrate, intercepts)
+        filename = 'vial'+str(vialnums[z])+'_'+slugify(samplenames[z])+'.png'
 
-        #Initializes figure on which the OD data and growth rates will be plotted on two different axes
+        #Initializes figure on which the OD data and growth rates will be plotted on two different axes, only if the user wants to check it
         #ax1 contains OD data, ax2 contains growth rates
-        fig, (ax1, ax2) = plt.subplots(2, sharex = True, figsize = (10,10))
-
-        #gets times of/immediately after pump events and the growth rate of the section immediately prior the pump event
-        times, onlypumpgrowthrate, ax1 = pumpgrowthrates(vialOD, vialpumptimes, ax1)
+        if selfcheck == 'yes':
+            fig, (ax1, ax2) = plt.subplots(2, sharex = True, figsize = (10,10))
+            drawOD(ax1, plotdata)
 
         #Intializes variables, later can be user defined
         happy = "sad"
@@ -340,43 +2391,29 @@ def main():
         #Initializes a while loop that will continue going until the user is happy with the fit
         while happy == "sad":
 
-            #Ensures that there are enough pump data points to be confident in the obtained growth rates
-            if len(onlypumpgrowthrate) > minimumpumpsrequired:
-
-                #Converts the window size into how far it goes in either direction (minus the base position)
-                eithersidewindow = int((windowsize - 1) / 2)
+            #Finds the window with the flattest growth rates, or None if there are not enough pump data points to be confident in the obtained growth rates
+            window = findwindow(times, onlypumpgrowthrate, minimumpumpsrequired, windowsize, residualallowed)
 
-                #Gets initial window and associated values
-                baseindex, baseresidual, basemean = getwindowresiduals(times, onlypumpgrowthrate, eithersidewindow)
+            if window is not None:
 
-                #Adds growth rates to window as time increases until error is too large
-                stop = expandright(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow)
-
-                #Adds growth rates to window as time decreases until error is too large
-                begin = expandleft(onlypumpgrowthrate, times, baseindex, basemean, baseresidual, residualallowed, eithersidewindow)
-
-                #Graphs the growth rates and the final window
-                ax2.scatter(times, onlypumpgrowthrate)
-                ax2.axvline(x = times[baseindex+stop])
-                ax2.axvline(x = times[baseindex-begin])
+                baseindex, begin, stop = window
+                windowlines = (baseindex-begin, baseindex+stop)
 
                 #Stores important data in array data
-                data = [samplenames[z], np.median(onlypumpgrowthrate[baseindex-begin:baseindex+stop]), np.mean(onlypumpgrowthrate[baseindex-begin:baseindex+stop]), np.std(onlypumpgrowthrate[baseindex-begin:baseindex+stop]), len(onlypumpgrowthrate[baseindex-begin:baseindex+stop]), np.median(onlypumpgrowthrate), np.mean(onlypumpgrowthrate), np.std(onlypumpgrowthrate), len(onlypumpgrowthrate), minimumpumpsrequired, windowsize, residualallowed]
+                data = summarydata(samplenames[z], onlypumpgrowthrate, baseindex-begin, baseindex+stop, minimumpumpsrequired, windowsize, residualallowed)
 
             else:
                 #Fails analysis if there are not enough growth rates (not enough pump events)
                 data = [samplenames[z], np.nan, np.nan, np.nan, np.nan] 
                 print('Vial'+str(vialnums[z])+' failed analysis because it had too few data points.')
-                ax2.scatter(times, onlypumpgrowthrate)
-
-            #Finishing touches on graphs and saves as a png
-            fig.suptitle(samplenames[z], fontsize = 20)
-            ax1.set(ylabel = 'Natural log of OD 600')
-            ax2.set(xlabel = 'Time (h)', ylabel = 'Specific growth rate (h^-1)')
-            fig.tight_layout()
-            fig.savefig('vial'+str(vialnums[z])+'_'+slugify(samplenames[z])+'.png', bbox_inches = 'tight', facecolor = 'white')
+                windowlines = None
                       
             if selfcheck == 'yes':
+
+                #Graphs the growth rates and the final window, finishing touches on graphs and saves as a png
+                drawgrowthrates(ax2, times, onlypumpgrowthrate, windowlines)
+                finishfigure(fig, ax1, ax2, samplenames[z])
+                fig.savefig(filename, bbox_inches = 'tight', facecolor = 'white')
             
                 fig.show()
 
@@ -396,16 +2433,13 @@ def main():
                             #Clears old graph and makes new graph with the user-defined window
                             ax2.clear()
 
-                            ax2.scatter(times, onlypumpgrowthrate)
-
                             startindex, stopindex = fittingbyself(start, stop, times)
 
-                            ax2.axvline(x = times[startindex])
-                            ax2.axvline(x = times[stopindex])
+                            drawgrowthrates(ax2, times, onlypumpgrowthrate, (startindex, stopindex))
 
-                            data = [samplenames[z], np.median(onlypumpgrowthrate[startindex:stopindex]), np.mean(onlypumpgrowthrate[startindex:stopindex]), np.std(onlypumpgrowthrate[startindex:stopindex]), len(onlypumpgrowthrate[startindex:stopindex]), np.median(onlypumpgrowthrate), np.mean(onlypumpgrowthrate), np.std(onlypumpgrowthrate), len(onlypumpgrowthrate), "Defined by user"]
+                            data = summarydata(samplenames[z], onlypumpgrowthrate, startindex, stopindex, "Defined by user")
 
-                            fig.savefig('vial'+str(vialnums[z])+'_'+slugify(samplenames[z])+'.png', bbox_inches = 'tight', facecolor = 'white')
+                            fig.savefig(filename, bbox_inches = 'tight', facecolor = 'white')
 
                             happy = input('Check the figure (and leave it open or the script may fail later). Are you happy or sad with these results? (i.e., would you like to relax the analysis parameters or manually define the window): input "happy" or "sad" without quotations: ') 
 
@@ -417,8 +2451,14 @@ def main():
                         ax2.clear()
                          
             else:
+                #Saves the figure without showing it
+                savevialfigure(filename, samplenames[z], plotdata, times, onlypumpgrowthrate, windowlines)
                 happy = "happy"
 
+        #Closes the figure so figures don't pile up across vials
+        if selfcheck == 'yes':
+            plt.close(fig)
+
         #Adds the stored important data from data array to the sampledata array, which is eventually saved as CSV               
         sampledata.append(data)
 
@@ -426,12 +2466,11 @@ def main():
     outputfilename = input('Please enter what you would like the output file to be named (do not include .csv): ')    
 
     #Exports sampledata array as a CSV
-    with open(outputfilename+'.csv', 'w', newline = '') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["sample name", "trimmed median", "trimmed average", "trimmed standard deviaiton", "# of cycles included", "untrimmed median", "untrimmed average", "untrimmed standard deviation", "total # of cycles in run", "Minimum pump events required", "Initial window size", "Residuals allowed"])
-        for z in range(len(sampledata)):
-                       writer.writerow(sampledata[z])
+    writesampledata(outputfilename+'.csv', sampledata)
                 
                 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        cli(sys.argv[1:])
+    else:
+        main()
\ No newline at end of file
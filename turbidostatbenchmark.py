@@ -0,0 +1,350 @@
+import argparse
+import csv
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from statistics import mean
+
+
+#Benchmarks each stage of 230925_turbidostatanalysisscript.py on synthetic experiments of different sizes and checks that the results haven't changed
+#Run from anywhere with: python turbidostatbenchmark.py
+#Use --scales to pick the experiment sizes (hours x vials), e.g. --scales 70x16,336x96,70x1000
+#Also checks that importing the script and analyzing one vial stays within --startup-budget seconds without loading matplotlib
+#Exits with 1 if any of the checks fail, so it can be used after every speedup
+
+
+#Loads the analysis script, which can't be imported by name since it starts with a number
+def loadscript():
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '230925_turbidostatanalysisscript.py')
+    spec = importlib.util.spec_from_file_location('turbidostatanalysisscript', path)
+    script = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(script)
+
+    return(script)
+
+
+#Reads the experiment sizes given on the command line, e.g. 70x16,336x16
+#Returns a list of (hours, vials)
+def parsescales(text):
+
+    scales = []
+    for scale in text.split(','):
+        hours, vials = scale.lower().split('x')
+        scales.append((float(hours), int(vials)))
+
+    return(scales)
+
+
+#Times every stage of the analysis on one synthetic experiment
+#Only the first plotvials vials are graphed, since graphing is by far the slowest stage
+#Returns a list of [stage, seconds, rows per second, vials per second]
+def benchmarkscale(script, hours, vials, workdir, plotvials):
+
+    datadir = os.path.join(workdir, str(hours)+'x'+str(vials))
+    script.generateexperiment(datadir, vials, hours = hours)
+    vialnums = list(range(vials))
+    timings = []
+
+    def stage(name, function, stagevials):
+        started = time.perf_counter()
+        results = [function(z) for z in stagevials]
+        seconds = time.perf_counter() - started
+        timings.append([name, seconds, rows * len(stagevials) / vials / seconds if seconds > 0 else np.inf, len(stagevials) / seconds if seconds > 0 else np.inf])
+        return(results)
+
+    rows = 0
+    for z in vialnums:
+        rows = rows + len(script.importOD(z, datadir, cache = False))
+
+    loaded = stage('load (text)', lambda z: (script.importOD(z, datadir, cache = False), script.importpumptimes(z, datadir, cache = False)), vialnums)
+    stage('load (sidecar written)', lambda z: (script.importOD(z, datadir), script.importpumptimes(z, datadir)), vialnums)
+    stage('load (sidecar mapped)', lambda z: (script.importOD(z, datadir), script.importpumptimes(z, datadir)), vialnums)
+    fits = stage('segment fits', lambda z: script.segmentfits(*loaded[z]), vialnums)
+    windows = stage('window search', lambda z: script.findwindow(fits[z][4], fits[z][5], 10, 11, 5), vialnums)
+
+    def plotvial(z):
+        t, y, starts, ends, times, onlypumpgrowthrate, intercepts = fits[z]
+        windowlines = None if windows[z] is None else (windows[z][0]-windows[z][1], windows[z][0]+windows[z][2])
+        script.savevialfigure(os.path.join(datadir, 'vial'+str(z)+'.png'), 'vial'+str(z), script.vialplotdata(t, y, starts, ends, onlypumpgrowthrate, intercepts), times, onlypumpgrowthrate, windowlines)
+    stage('plotting', plotvial, vialnums[:plotvials])
+
+    sampledata = []
+    for z in vialnums:
+        if windows[z] is None:
+            sampledata.append(['vial'+str(z), np.nan, np.nan, np.nan, np.nan])
+        else:
+            baseindex, begin, stop = windows[z]
+            sampledata.append(script.summarydata('vial'+str(z), fits[z][5], baseindex-begin, baseindex+stop, 10, 11, 5))
+    stage('CSV write', lambda z: script.writesampledata(os.path.join(datadir, 'output.csv'), sampledata), [0])
+    timings[-1][3] = vials / timings[-1][1]
+    timings[-1][2] = rows / timings[-1][1]
+
+    return(timings)
+
+
+#Copies the sample vial files into workdir, so the checks can leave their sidecars there instead of in the repository
+#Returns the directory they were copied to
+def copysampledata(workdir):
+
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sample_data')
+    sampledir = os.path.join(workdir, 'Sample_data')
+    os.makedirs(sampledir, exist_ok = True)
+    for filename in os.listdir(source):
+        if filename.startswith('vial') and filename.endswith('.txt'):
+            shutil.copy2(os.path.join(source, filename), sampledir)
+
+    return(sampledir)
+
+
+#Checks the sample data against the saved outputs
+#Sample_data/wholesetnumbersdefault.csv was made with the default settings and has to match completely
+#Sample_data/wholesetnumbers230728.csv was made by an earlier version of the script, so only its untrimmed columns (which only depend on the fits) have to match
+#Takes in the copy of the sample vial files made by copysampledata()
+#Returns a list of failures
+def checkgolden(script, sampledir):
+
+    golddir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Sample_data')
+    with open(os.path.join(golddir, 'wholesetnumbers230728.csv'), newline = '') as csvfile:
+        old = list(csv.reader(csvfile))[1:]
+    with open(os.path.join(golddir, 'wholesetnumbersdefault.csv'), newline = '') as csvfile:
+        default = list(csv.reader(csvfile))[1:]
+
+    failures = []
+    for z in range(len(default)):
+        data, plotjob, series = script.analyzevial(sampledir, z, default[z][0], plot = False)
+        if not np.allclose([float(x) for x in data[1:]], [float(x) for x in default[z][1:]], rtol = 1e-9, equal_nan = True):
+            failures.append('vial'+str(z)+' does not match wholesetnumbersdefault.csv: '+str(data))
+        if not np.allclose([data[5], data[6]], [float(old[z][3]), float(old[z][4])], rtol = 1e-9):
+            failures.append('vial'+str(z)+' untrimmed growth rates do not match wholesetnumbers230728.csv')
+
+    return(failures)
+
+
+#Checks that two pumps with no OD reading between them don't make the whole row NaN
+#Adds a second pump 0.0001 h after pump 50 of sample vial 0, which leaves a section without any points
+#Takes in the copy of the sample vial files made by copysampledata()
+#Returns a list of failures
+def checkemptysection(script, sampledir):
+
+    datadir = os.path.join(os.path.dirname(sampledir), 'emptysection')
+    os.makedirs(datadir, exist_ok = True)
+    shutil.copy2(os.path.join(sampledir, 'vial0_OD.txt'), datadir)
+    with open(os.path.join(sampledir, 'vial0_pump_log.txt')) as pumpfile:
+        lines = pumpfile.readlines()
+    #The header and the 0,0 line come before pump 1
+    pump = lines[51].split(',')
+    lines.insert(52, str(float(pump[0]) + 0.0001)+','+pump[1])
+    with open(os.path.join(datadir, 'vial0_pump_log.txt'), 'w') as pumpfile:
+        pumpfile.writelines(lines)
+
+    data, plotjob, series = script.analyzevial(datadir, 0, 'emptysection', plot = False)
+    if not np.all(np.isfinite(np.asarray(data[1:9], dtype = float))):
+        return(['a pump right after another gives '+str(data)])
+
+    return([])
+
+
+#Checks that the growth rates used to make a synthetic experiment are recovered to within tolerance (h^-1)
+#Returns a list of failures
+def checkrecovery(script, workdir, tolerance = 0.005):
+
+    datadir = os.path.join(workdir, 'recovery')
+    growthrates = script.generateexperiment(datadir, 16, seed = 1)
+
+    failures = []
+    for z in growthrates:
+        data, plotjob, series = script.analyzevial(datadir, z, 'vial'+str(z), plot = False)
+        if not abs(data[1] - growthrates[z]) <= tolerance:
+            failures.append('vial'+str(z)+' trimmed median '+str(data[1])+' is not within '+str(tolerance)+' of '+str(growthrates[z]))
+
+    return(failures)
+
+
+#Random series of growth rates for the equivalence checks: a ramp up to a plateau plus noise
+#With decimals, the growth rates are rounded so that many windows tie exactly
+#Returns a list of (times, growth rates, windowsize, residualallowed)
+def randomseries(count, seed, decimals = None):
+
+    rng = np.random.default_rng(seed)
+    series = []
+    for x in range(count):
+        n = int(rng.integers(5, 80))
+        times = np.cumsum(rng.uniform(0.2, 1, n))
+        plateau = rng.uniform(0.1, 0.4)
+        growthrates = plateau * np.minimum(1, rng.uniform(0.2, 1) + times / rng.uniform(5, 40)) + rng.normal(0, rng.uniform(0.002, 0.05), n)
+        if decimals is not None:
+            growthrates = np.round(growthrates, decimals)
+        series.append((times, growthrates, int(rng.choice([3, 5, 7, 11])), float(rng.choice([1, 2, 5, 10]))))
+
+    return(series)
+
+
+#The window search as it was first written, one window at a time, to check the running-sum version against
+#Returns baseindex, begin and stop, or None like findwindow()
+def loopfindwindow(times, onlypumpgrowthrate, minimumpumpsrequired, windowsize, residualallowed):
+
+    onlypumpgrowthrate = list(onlypumpgrowthrate)
+    if len(onlypumpgrowthrate) <= minimumpumpsrequired or len(onlypumpgrowthrate) < windowsize:
+        return(None)
+    eithersidewindow = int((windowsize - 1) / 2)
+
+    residuals = []
+    for x in range(eithersidewindow, len(onlypumpgrowthrate)-eithersidewindow):
+        test = onlypumpgrowthrate[x-eithersidewindow:x+eithersidewindow+1]
+        mean_ = mean(test)
+        residuals.append(sum((value - mean_)**2 for value in test))
+    baseindex = residuals.index(min(residuals)) + eithersidewindow
+    baseresidual = min(residuals) / ((eithersidewindow+1)*2)
+    basemean = mean(onlypumpgrowthrate[baseindex-eithersidewindow:baseindex+eithersidewindow+1])
+
+    stop = len(onlypumpgrowthrate) - baseindex - 2
+    for x in range(eithersidewindow+1, len(onlypumpgrowthrate[baseindex:])-eithersidewindow):
+        test = onlypumpgrowthrate[baseindex-eithersidewindow:baseindex+x]
+        if sum((value - basemean)**2 for value in test) / len(test) > baseresidual * residualallowed:
+            stop = x - 2
+            break
+
+    begin = baseindex - 2
+    for x in range(eithersidewindow+1, len(onlypumpgrowthrate[:baseindex])):
+        test = onlypumpgrowthrate[baseindex-x:baseindex+eithersidewindow]
+        if sum((value - basemean)**2 for value in test) / len(test) > baseresidual * residualallowed:
+            begin = x - 1
+            break
+
+    return(baseindex, begin, stop)
+
+
+#Checks that the running-sum window search (findwindow()) finds the same windows as the one-window-at-a-time loops, also when the growth rates are rounded and windows tie
+#Returns a list of failures (at most 5)
+def checkwindowsearch(script, count = 2000):
+
+    failures = []
+    for times, growthrates, windowsize, residualallowed in randomseries(count, 2) + randomseries(count, 5, decimals = 2):
+        expected = loopfindwindow(times, growthrates, 3, windowsize, residualallowed)
+        found = script.findwindow(times, growthrates, 3, windowsize, residualallowed)
+        if found != expected:
+            failures.append('findwindow() gave '+str(found)+' where the loops give '+str(expected)+' (window size '+str(windowsize)+', residuals allowed '+str(residualallowed)+')')
+
+    return(failures[:5])
+
+
+#Checks that WindowTracker, given the growth rates one at a time as the follow command does, always has the same window as findwindow() on the growth rates so far
+#Returns a list of failures (at most 5)
+def checkwindowtracker(script, count = 300):
+
+    failures = []
+    for times, growthrates, windowsize, residualallowed in randomseries(count, 3) + randomseries(count, 6, decimals = 2):
+        tracker = script.WindowTracker(3, windowsize, residualallowed)
+        for x in range(len(growthrates)):
+            tracker.append(times[x], growthrates[x])
+            expected = script.findwindow(times[:x+1], growthrates[:x+1], 3, windowsize, residualallowed)
+            found = tracker.window()
+            if found != expected:
+                failures.append('WindowTracker gave '+str(found)+' after '+str(x+1)+' growth rates where findwindow() gives '+str(expected)+' (window size '+str(windowsize)+', residuals allowed '+str(residualallowed)+')')
+                break
+
+    return(failures[:5])
+
+
+#Checks that findwindows(), which the bootstrap uses to search many resamples at once, finds the same window in every row as findwindow() does on that row alone
+#Every series is given 50 noisy copies of itself as the rows, rounded like the series for the rounded ones
+#Returns a list of failures (at most 5)
+def checkfindwindows(script, count = 300):
+
+    rng = np.random.default_rng(4)
+    failures = []
+    for decimals, seed in ((None, 4), (2, 7)):
+        for times, growthrates, windowsize, residualallowed in randomseries(count, seed, decimals):
+            rows = growthrates + rng.normal(0, rng.uniform(0.001, 0.02), (50, len(growthrates)))
+            if decimals is not None:
+                rows = np.round(rows, decimals)
+            windows = script.findwindows(times, rows, 3, windowsize, residualallowed)
+            for x in range(len(rows)):
+                expected = script.findwindow(times, rows[x], 3, windowsize, residualallowed)
+                found = None if windows is None else tuple(int(values[x]) for values in windows)
+                if found != expected:
+                    failures.append('findwindows() gave '+str(found)+' for a row where findwindow() gives '+str(expected)+' (window size '+str(windowsize)+', residuals allowed '+str(residualallowed)+')')
+                    break
+
+    return(failures[:5])
+
+
+#What each startup run does in a fresh interpreter: import the script and analyze one sample vial without graphing it
+#Prints the seconds that took and whether matplotlib got imported along the way
+startupcode = """
+import time
+started = time.perf_counter()
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location('turbidostatanalysisscript', sys.argv[1])
+script = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(script)
+script.analyzevial(sys.argv[2], 0, 'vial0', plot = False)
+print(time.perf_counter() - started, 'matplotlib' in sys.modules)
+"""
+
+
+#Checks that importing the script and analyzing one sample vial stays within budget seconds, and that it doesn't load matplotlib
+#Runs in a fresh interpreter each time and keeps the fastest of repeats runs, so a busy machine doesn't fail the check
+#Takes in the copy of the sample vial files made by copysampledata()
+#Returns the seconds and a list of failures
+def checkstartup(budget, sampledir, repeats = 3):
+
+    arguments = [sys.executable, '-c', startupcode, os.path.join(os.path.dirname(os.path.abspath(__file__)), '230925_turbidostatanalysisscript.py'), sampledir]
+
+    runs = []
+    for repeat in range(repeats):
+        seconds, plotting = subprocess.run(arguments, capture_output = True, text = True, check = True).stdout.split()[-2:]
+        runs.append(float(seconds))
+
+    failures = []
+    if min(runs) > budget:
+        failures.append('import and analysis of one vial took '+str(min(runs))+' s, more than the budget of '+str(budget)+' s')
+    if plotting == 'True':
+        failures.append('analysis without figures imported matplotlib')
+
+    return(min(runs), failures)
+
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description = 'Benchmark and regression checks for the turbidostat analysis script.')
+    parser.add_argument('--scales', type = parsescales, default = parsescales('70x16,336x16,70x96'), help = 'experiment sizes as hours x vials (default 70x16,336x16,70x96)')
+    parser.add_argument('--plot-vials', dest = 'plotvials', type = int, default = 4, help = 'number of vials to graph at each size (default 4)')
+    parser.add_argument('--startup-budget', dest = 'startupbudget', type = float, default = 0.5, help = 'seconds allowed for importing the script and analyzing one sample vial (default 0.5)')
+    parser.add_argument('--no-benchmark', dest = 'benchmark', action = 'store_false', help = 'only run the checks')
+    args = parser.parse_args(argv)
+
+    script = loadscript()
+    failures = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+
+        if args.benchmark:
+            for hours, vials in args.scales:
+                print(str(hours)+' h x '+str(vials)+' vials')
+                for name, seconds, rowrate, vialrate in benchmarkscale(script, hours, vials, workdir, args.plotvials):
+                    print('    {:<24}{:>10.4f} s{:>14.0f} rows/s{:>10.1f} vials/s'.format(name, seconds, rowrate, vialrate))
+
+        sampledir = copysampledata(workdir)
+        failures = checkgolden(script, sampledir) + checkemptysection(script, sampledir) + checkrecovery(script, workdir) + checkwindowsearch(script) + checkwindowtracker(script) + checkfindwindows(script)
+
+        seconds, startupfailures = checkstartup(args.startupbudget, sampledir)
+        print('import + one vial: {:.3f} s (budget {} s)'.format(seconds, args.startupbudget))
+        failures = failures + startupfailures
+
+    for failure in failures:
+        print('FAILED: '+failure)
+    if len(failures) == 0:
+        print('All checks passed')
+
+    return(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))